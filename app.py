@@ -7,21 +7,31 @@ No RAG functionality - only handles AI agent responses.
 import os
 import time
 import uuid
-import subprocess
-import platform
 from typing import Any, Dict, Optional
 
 import requests
 from dotenv import load_dotenv
 from flask import Flask, jsonify, render_template, request, send_from_directory
 
+from services import metrics
+from services.clipboard import ClipboardWorker
+from services.log import get_logger, truncate
+from services.pending_responses import get_response_waiters
+from services.webhook_client import get_webhook_client
+
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
+metrics.instrument_flask(app)
+log = get_logger(__name__)
+# Clipboard tool is detected once here; copies run on the worker thread
+clipboard = ClipboardWorker()
 
-# In-memory storage for AI responses (in production, use Redis or database)
-ai_responses: Dict[str, Any] = {}
+# Waiters for AI responses delivered via /webhook_response (PENDING_STORE=sqlite to share across workers)
+ai_responses = get_response_waiters()
+# Seconds a chat request waits for the AI agent's webhook response
+AI_RESPONSE_TIMEOUT = float(os.getenv("AI_RESPONSE_TIMEOUT", "60"))
 
 
 def _get_webhook_url() -> Optional[str]:
@@ -29,52 +39,29 @@ def _get_webhook_url() -> Optional[str]:
     return os.getenv("WEBHOOK_URL")
 
 
-def _copy_to_clipboard(text: str) -> bool:
-    """Copy text to system clipboard"""
-    try:
-        system = platform.system()
-        
-        if system == "Windows":
-            # Windows: use clip command
-            subprocess.run(["clip"], input=text, text=True, check=True)
-        elif system == "Darwin":  # macOS
-            # macOS: use pbcopy
-            subprocess.run(["pbcopy"], input=text, text=True, check=True)
-        elif system == "Linux":
-            # Linux: try xclip first, then xsel
-            try:
-                subprocess.run(["xclip", "-selection", "clipboard"], input=text, text=True, check=True)
-            except (subprocess.CalledProcessError, FileNotFoundError):
-                subprocess.run(["xsel", "--clipboard", "--input"], input=text, text=True, check=True)
-        else:
-            print(f"WARNING: Unsupported platform {system} for clipboard operations")
-            return False
-            
-        print(f"✓ Successfully copied {len(text)} characters to clipboard")
-        return True
-        
-    except Exception as e:
-        print(f"ERROR: Failed to copy to clipboard: {str(e)}")
-        return False
+def _response_text(ai_response: Any) -> str:
+    """Text of an AI response, as copied to the clipboard"""
+    if isinstance(ai_response, dict):
+        for key in ("output", "message", "content"):
+            if ai_response.get(key):
+                return str(ai_response[key])
+        return str(ai_response)
+    if isinstance(ai_response, str):
+        return ai_response
+    return str(ai_response)
 
 
 def _post_to_webhook(payload: Dict[str, Any]) -> Dict[str, Any]:
     """Send payload to webhook URL"""
     webhook_url = _get_webhook_url()
     if not webhook_url:
-        print("WARNING: No WEBHOOK_URL environment variable set")
+        log.warning("No WEBHOOK_URL environment variable set")
         return {"error": "No webhook URL configured"}
     
     try:
-        print(f"DEBUG: Sending to webhook: {webhook_url}")
-        print(f"DEBUG: Payload: {payload}")
-        
-        response = requests.post(webhook_url, json=payload, timeout=30)
-        
-        print(f"DEBUG: Response status code: {response.status_code}")
-        print(f"DEBUG: Response headers: {dict(response.headers)}")
-        print(f"DEBUG: Response text: {response.text}")
-        
+        log.debug("Sending %s to webhook: %s", payload.get("event"), truncate(payload))
+        response = get_webhook_client().post(webhook_url, payload)
+        log.debug("Webhook returned %s: %s", response.status_code, truncate(response.text))
         if response.status_code == 200:
             try:
                 return {"response": response.json()}
@@ -84,23 +71,20 @@ def _post_to_webhook(payload: Dict[str, Any]) -> Dict[str, Any]:
             return {"error": f"Webhook returned status {response.status_code}"}
             
     except requests.exceptions.RequestException as e:
-        print(f"ERROR: Webhook request failed: {str(e)}")
+        log.error("Webhook request failed: %s", e)
         return {"error": str(e)}
 
 
-def _poll_for_ai_response(request_id: str, max_attempts: int = 30, delay: int = 2) -> Optional[Any]:
-    """Poll for AI response using exponential backoff"""
-    for attempt in range(max_attempts):
-        if request_id in ai_responses:
-            response = ai_responses.pop(request_id)  # Remove after retrieval
-            print(f"DEBUG: Found AI response for request_id: {request_id}")
-            return response
-        
-        print(f"DEBUG: Polling attempt {attempt + 1}/{max_attempts} for request_id: {request_id}")
-        time.sleep(delay)
-    
-    print(f"DEBUG: Timeout waiting for AI response for request_id: {request_id}")
-    return None
+def _wait_for_ai_response(request_id: str, timeout: float = AI_RESPONSE_TIMEOUT) -> Optional[Any]:
+    """Block until /webhook_response delivers the AI response, or timeout seconds pass"""
+    with metrics.STAGE_SECONDS.time(stage="ai_response_wait"):
+        response = ai_responses.wait(request_id, timeout)
+    if response is None:
+        metrics.AI_RESPONSE_TIMEOUTS.inc()
+        log.warning("Timeout waiting for AI response for request_id %s", request_id)
+    else:
+        log.debug("Found AI response for request_id %s", request_id)
+    return response
 
 
 # Routes
@@ -124,7 +108,7 @@ def chat() -> Any:
         if not message:
             return jsonify({"error": "Missing message"}), 400
         
-        print(f"DEBUG: Chat request - message: {message}")
+        log.debug("Chat request: %s", truncate(message))
         
         # Use the same AI search functionality
         payload = {"event": "chat_message", "query": message}
@@ -132,49 +116,26 @@ def chat() -> Any:
         
         # Check if webhook result contains AI response
         ai_response = None
+        clipboard_queued = False
         if webhook_result.get("response"):
             ai_response = webhook_result["response"]
-            print(f"DEBUG: AI response found in webhook result: {ai_response}")
-            
-            # DIRECT CLIPBOARD COPY: Copy AI response to clipboard immediately
-            if ai_response:
-                response_text = ""
-                if isinstance(ai_response, dict):
-                    if ai_response.get("output"):
-                        response_text = ai_response["output"]
-                    elif ai_response.get("message"):
-                        response_text = ai_response["message"]
-                    elif ai_response.get("content"):
-                        response_text = ai_response["content"]
-                    else:
-                        response_text = str(ai_response)
-                elif isinstance(ai_response, str):
-                    response_text = ai_response
-                else:
-                    response_text = str(ai_response)
-                
-                if response_text:
-                    print(f"DEBUG: Copying AI response to clipboard: {response_text[:100]}...")
-                    clipboard_success = _copy_to_clipboard(response_text)
-                    if clipboard_success:
-                        print("✓ AI response copied to clipboard successfully!")
-                    else:
-                        print("❌ Failed to copy AI response to clipboard")
+            log.debug("AI response found in webhook result: %s", truncate(ai_response))
+            # Handed to the clipboard worker; the request does not wait for the copy
+            clipboard_queued = clipboard.copy(_response_text(ai_response))
         
         # Return response in the format expected by the web interface
         result = {
             "status": "success",
             "webhook_response": webhook_result,
-            "clipboard_copied": ai_response is not None
+            "clipboard_copied": clipboard_queued
         }
         if ai_response:
             result["ai_response"] = ai_response
-            print(f"DEBUG: Added AI response to result")
         
         return jsonify(result)
         
     except Exception as e:
-        print(f"ERROR: Exception in chat: {str(e)}")
+        log.exception("Exception in chat")
         return jsonify({"error": str(e)}), 500
 
 
@@ -186,7 +147,7 @@ def ai_search() -> Any:
     if not query:
         return jsonify({"error": "Missing query"}), 400
     
-    print(f"DEBUG: AI search request - query: {query}")
+    log.debug("AI search request: %s", truncate(query))
     
     # Create payload for webhook
     payload = {"event": "ai_search", "query": query}
@@ -194,34 +155,12 @@ def ai_search() -> Any:
     
     # Check if webhook result contains AI response
     ai_response = None
+    clipboard_queued = False
     if webhook_result.get("response"):
         ai_response = webhook_result["response"]
-        print(f"DEBUG: AI response found in webhook result: {ai_response}")
-        
-        # DIRECT CLIPBOARD COPY: Copy AI response to clipboard immediately
-        if ai_response:
-            response_text = ""
-            if isinstance(ai_response, dict):
-                if ai_response.get("output"):
-                    response_text = ai_response["output"]
-                elif ai_response.get("message"):
-                    response_text = ai_response["message"]
-                elif ai_response.get("content"):
-                    response_text = ai_response["content"]
-                else:
-                    response_text = str(ai_response)
-            elif isinstance(ai_response, str):
-                response_text = ai_response
-            else:
-                response_text = str(ai_response)
-            
-            if response_text:
-                print(f"DEBUG: Copying AI response to clipboard: {response_text[:100]}...")
-                clipboard_success = _copy_to_clipboard(response_text)
-                if clipboard_success:
-                    print("✓ AI response copied to clipboard successfully!")
-                else:
-                    print("❌ Failed to copy AI response to clipboard")
+        log.debug("AI response found in webhook result: %s", truncate(ai_response))
+        # Handed to the clipboard worker; the request does not wait for the copy
+        clipboard_queued = clipboard.copy(_response_text(ai_response))
     
     # Return only AI response and webhook info
     result = {
@@ -230,11 +169,10 @@ def ai_search() -> Any:
         "hits": [],
         "images": {},
         "image_paths": {},
-        "clipboard_copied": ai_response is not None
+        "clipboard_copied": clipboard_queued
     }
     if ai_response:
         result["ai_response"] = ai_response
-        print(f"DEBUG: Added AI response to result")
     
     return jsonify(result)
 
@@ -242,7 +180,6 @@ def ai_search() -> Any:
 @app.route("/ai_chat", methods=["POST"])
 def ai_chat_with_rag() -> Any:
     """Handle AI chat requests from extension"""
-    print("DEBUG: /ai_chat route called")
     try:
         data = request.get_json()
         query = data.get("query", "").strip()
@@ -268,7 +205,10 @@ def ai_chat_with_rag() -> Any:
             "rag_context": rag_context
         }
         
-        print(f"DEBUG: Sending to AI agent: {payload}")
+        log.info("Sending chat %s to AI agent", request_id)
+        
+        # Register before sending so a fast /webhook_response is not missed
+        ai_responses.register(request_id)
         
         # Send to webhook
         webhook_result = _post_to_webhook(payload)
@@ -276,8 +216,8 @@ def ai_chat_with_rag() -> Any:
         
         # Check if this is a workflow start response
         if response_data.get("message") == "Workflow was started":
-            print("DEBUG: Workflow started, polling for response...")
-            ai_response = _poll_for_ai_response(request_id, max_attempts=30, delay=2)
+            log.debug("Workflow started, waiting for response to %s", request_id)
+            ai_response = _wait_for_ai_response(request_id)
             
             if ai_response:
                 return jsonify({
@@ -294,6 +234,7 @@ def ai_chat_with_rag() -> Any:
                 })
         else:
             # Direct response
+            ai_responses.discard(request_id)
             return jsonify({
                 "status": "success",
                 "ai_response": response_data,
@@ -302,9 +243,7 @@ def ai_chat_with_rag() -> Any:
             })
         
     except Exception as e:
-        print(f"ERROR: Exception in ai_chat_with_rag: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Exception in ai_chat_with_rag")
         return jsonify({"error": str(e)}), 500
 
 
@@ -313,21 +252,21 @@ def webhook_response() -> Any:
     """Handle responses from n8n webhook (respond to webhook node)"""
     try:
         data = request.get_json()
-        print(f"DEBUG: Received webhook response: {data}")
+        log.debug("Received webhook response: %s", truncate(data))
         
         # Extract request_id from the response
         request_id = data.get("request_id")
         if request_id:
-            # Store the AI response for polling
-            ai_responses[request_id] = data
-            print(f"DEBUG: Stored AI response for request_id: {request_id}")
-            return jsonify({"status": "received", "message": "Response stored for polling"})
+            # Wake the request waiting for this response
+            ai_responses.deliver(request_id, data)
+            log.info("Delivered AI response for request_id %s", request_id)
+            return jsonify({"status": "received", "message": "Response delivered"})
         else:
-            print("WARNING: No request_id in webhook response")
+            log.warning("No request_id in webhook response")
             return jsonify({"status": "received", "message": "Response processed but no request_id"})
         
     except Exception as e:
-        print(f"ERROR: Error processing webhook response: {str(e)}")
+        log.exception("Error processing webhook response")
         return jsonify({"error": str(e)}), 500
 
 
@@ -340,7 +279,19 @@ def get_webhook_url() -> Any:
 
 @app.route("/health")
 def health():
-    return jsonify({"status": "ok"})
+    return jsonify(
+        {
+            "status": "ok",
+            "pending_responses": ai_responses.stats(),
+            "webhook": get_webhook_client().stats(),
+            "clipboard": clipboard.stats(),
+        }
+    )
+
+
+@app.route("/metrics")
+def metrics_endpoint() -> Any:
+    return metrics.render(), 200, {"Content-Type": metrics.CONTENT_TYPE}
 
 
 @app.route("/static/<path:filename>")
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Asynchronous AI chat front-end (ASGI, no framework) with Server-Sent Events.
+
+A chat is accepted immediately and answered with a request id; the client
+then opens the SSE stream for that id and receives the agent's result (and
+any partial tokens the n8n workflow posts) as soon as /webhook_response gets
+them. A pending chat costs one socket and a small queue, not an OS thread.
+
+Run with any ASGI server, e.g.:
+    uvicorn app_async:app --host 0.0.0.0 --port 5001
+
+Point the n8n "respond" node at this server's /webhook_response. Partial
+output is posted as {"request_id": ..., "partial": "..."}; anything without
+"partial" is treated as the final response.
+"""
+
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+import requests
+from dotenv import load_dotenv
+
+from services.log import get_logger
+from services.webhook_client import get_webhook_client
+
+load_dotenv()
+log = get_logger(__name__)
+
+# Seconds a chat stream stays open waiting for the AI agent
+AI_RESPONSE_TIMEOUT = float(os.getenv("AI_RESPONSE_TIMEOUT", "60"))
+# SSE comment sent this often so proxies do not close idle streams
+SSE_HEARTBEAT_SECONDS = 15.0
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+def _get_webhook_url() -> Optional[str]:
+    """Get webhook URL from environment variable"""
+    return os.getenv("WEBHOOK_URL")
+
+
+def _post_to_webhook(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Send payload to webhook URL (blocking; run in a worker thread)"""
+    webhook_url = _get_webhook_url()
+    if not webhook_url:
+        return {"error": "No webhook URL configured"}
+    try:
+        response = get_webhook_client().post(webhook_url, payload)
+        if response.status_code == 200:
+            try:
+                return {"response": response.json()}
+            except ValueError:
+                return {"response": response.text}
+        return {"error": f"Webhook returned status {response.status_code}"}
+    except requests.exceptions.RequestException as e:
+        log.error("Webhook request failed: %s", e)
+        return {"error": str(e)}
+
+
+class _Channel:
+    """Events for one chat, buffered until (and while) its SSE stream reads them."""
+
+    def __init__(self) -> None:
+        self.queue: "asyncio.Queue[Tuple[str, Any]]" = asyncio.Queue()
+        self.deadline = time.monotonic() + AI_RESPONSE_TIMEOUT
+        self.finished = False
+
+    def push(self, event: str, data: Any) -> None:
+        if self.finished:
+            return
+        if event in ("result", "error"):
+            self.finished = True
+        self.queue.put_nowait((event, data))
+
+
+channels: Dict[str, _Channel] = {}
+# The event loop only keeps weak references to tasks; these stay referenced
+# until done so a dispatch cannot be garbage-collected mid-flight.
+_dispatch_tasks: Set["asyncio.Task[None]"] = set()
+
+
+async def _expire_channels() -> None:
+    """Drops channels whose deadline passed without a stream ever reading them."""
+    while True:
+        await asyncio.sleep(5)
+        now = time.monotonic()
+        for request_id in [rid for rid, ch in channels.items() if now > ch.deadline + SSE_HEARTBEAT_SECONDS]:
+            channels.pop(request_id, None)
+
+
+async def _read_json(receive: Receive) -> Any:
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    try:
+        return json.loads(body or b"null")
+    except ValueError:
+        return None
+
+
+async def _send_json(send: Send, status: int, data: Any) -> None:
+    body = json.dumps(data).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+def _sse(event: str, data: Any) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+async def _dispatch_chat(request_id: str, payload: Dict[str, Any]) -> None:
+    """Posts the chat to the AI agent off the event loop and routes a direct answer to the stream."""
+    webhook_result = await asyncio.to_thread(_post_to_webhook, payload)
+    channel = channels.get(request_id)
+    if channel is None:
+        return
+    if webhook_result.get("error"):
+        channel.push("error", webhook_result)
+        return
+    response_data = webhook_result.get("response", {})
+    if isinstance(response_data, dict) and response_data.get("message") == "Workflow was started":
+        # Real answer arrives later via /webhook_response
+        channel.push("status", {"status": "processing"})
+    else:
+        channel.push("result", response_data)
+
+
+async def ai_chat_async(scope: Scope, receive: Receive, send: Send) -> None:
+    data = await _read_json(receive)
+    query = (data or {}).get("query", "").strip() if isinstance(data, dict) else ""
+    if not query:
+        await _send_json(send, 400, {"error": "Missing query"})
+        return
+    if not _get_webhook_url():
+        await _send_json(send, 500, {"error": "No webhook URL configured"})
+        return
+
+    request_id = str(uuid.uuid4())
+    payload = {
+        "event": "chat_message",
+        "message": query,
+        "timestamp": data.get("timestamp", time.time()),
+        "session_id": data.get("session_id", f"extension_{int(time.time())}_{request_id[:8]}"),
+        "request_id": request_id,
+        "rag_context": data.get("rag_context", {}),
+    }
+    # Channel exists before the webhook is called, so an early response is buffered
+    channels[request_id] = _Channel()
+    task = asyncio.get_running_loop().create_task(_dispatch_chat(request_id, payload))
+    _dispatch_tasks.add(task)
+    task.add_done_callback(_dispatch_tasks.discard)
+    await _send_json(
+        send,
+        202,
+        {"status": "accepted", "request_id": request_id, "stream_url": f"/ai_chat/stream/{request_id}"},
+    )
+
+
+async def ai_chat_stream(scope: Scope, receive: Receive, send: Send, request_id: str) -> None:
+    channel = channels.get(request_id)
+    if channel is None:
+        await _send_json(send, 404, {"error": f"Unknown request_id: {request_id}"})
+        return
+
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                (b"x-accel-buffering", b"no"),
+            ],
+        }
+    )
+    disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        while True:
+            remaining = channel.deadline - time.monotonic()
+            if remaining <= 0:
+                await send({"type": "http.response.body", "body": _sse("timeout", {"status": "timeout"}), "more_body": True})
+                break
+            getter = asyncio.ensure_future(channel.queue.get())
+            done, _ = await asyncio.wait(
+                {getter, disconnected}, timeout=min(remaining, SSE_HEARTBEAT_SECONDS), return_when=asyncio.FIRST_COMPLETED
+            )
+            if disconnected in done:
+                getter.cancel()
+                return
+            if getter not in done:
+                getter.cancel()
+                await send({"type": "http.response.body", "body": b": keep-alive\n\n", "more_body": True})
+                continue
+            event, data = getter.result()
+            await send({"type": "http.response.body", "body": _sse(event, data), "more_body": True})
+            if event in ("result", "error"):
+                break
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        disconnected.cancel()
+        channels.pop(request_id, None)
+
+
+async def _wait_disconnect(receive: Receive) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def webhook_response(scope: Scope, receive: Receive, send: Send) -> None:
+    """Handle (partial or final) responses from n8n for a pending chat"""
+    data = await _read_json(receive)
+    if not isinstance(data, dict) or not data.get("request_id"):
+        await _send_json(send, 200, {"status": "received", "message": "Response processed but no request_id"})
+        return
+    channel = channels.get(data["request_id"])
+    if channel is None:
+        await _send_json(send, 404, {"status": "ignored", "message": "No pending chat for request_id"})
+        return
+    if "partial" in data:
+        channel.push("partial", {"request_id": data["request_id"], "partial": data["partial"]})
+    else:
+        channel.push("result", data)
+    await _send_json(send, 200, {"status": "received", "message": "Response delivered"})
+
+
+async def health(scope: Scope, receive: Receive, send: Send) -> None:
+    await _send_json(send, 200, {"status": "ok", "pending_chats": len(channels), "webhook": get_webhook_client().stats()})
+
+
+async def _lifespan(receive: Receive, send: Send) -> None:
+    expiry: Optional[asyncio.Task] = None
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            expiry = asyncio.get_running_loop().create_task(_expire_channels())
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            if expiry is not None:
+                expiry.cancel()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope: Scope, receive: Receive, send: Send) -> None:
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    method, path = scope["method"], scope["path"]
+    if path == "/ai_chat_async" and method == "POST":
+        await ai_chat_async(scope, receive, send)
+    elif path.startswith("/ai_chat/stream/") and method == "GET":
+        await ai_chat_stream(scope, receive, send, path[len("/ai_chat/stream/"):])
+    elif path == "/webhook_response" and method == "POST":
+        await webhook_response(scope, receive, send)
+    elif path == "/health" and method == "GET":
+        await health(scope, receive, send)
+    else:
+        await _send_json(send, 404, {"error": "Not found"})
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "5001")))
@@ -1,23 +1,60 @@
-import os
 import json
-import base64
-import tempfile
-import shutil
+import os
+import re
 import time
 import uuid
 from typing import Any, Dict
 import requests
 from dotenv import load_dotenv
 
-from flask import Flask, jsonify, render_template, request, send_from_directory
-
-# RAG functionality removed - only AI webhook communication
+from flask import Flask, abort, jsonify, render_template, request, send_from_directory
+from werkzeug.utils import secure_filename
+
+from services import image_store, metrics
+from services.jobs import JobQueue, QueueFull
+from services.log import get_logger, truncate
+from services.notifications import NotificationDispatcher
+from services.pending_responses import get_response_waiters
+from services.search_filters import SearchFilter
+from services.webhook_client import get_webhook_client
+from services.langchain_pipeline import (
+    SEARCH_K_MAX,
+    build_unified_index,
+    delete_document,
+    get_image_refs,
+    get_page_images,
+    index_status,
+    list_documents,
+    query_cache_stats,
+    search_unified_lc,
+    search_unified_lc_batch,
+)
 
 
 app = Flask(__name__)
-
-# In-memory storage for AI responses (in production, use Redis or database)
-ai_responses = {}
+metrics.instrument_flask(app)
+log = get_logger(__name__)
+
+# Waiters for AI responses delivered via /webhook_response (PENDING_STORE=sqlite to share across workers)
+ai_responses = get_response_waiters()
+# Seconds a chat request waits for the AI agent's webhook response
+AI_RESPONSE_TIMEOUT = float(os.environ.get("AI_RESPONSE_TIMEOUT", "60"))
+# Most queries one /search_lc/batch request may carry
+SEARCH_BATCH_MAX = int(os.environ.get("SEARCH_BATCH_MAX", "64"))
+
+# Background PDF ingestion: bounded concurrency and queue length
+ingest_jobs = JobQueue(
+    max_workers=int(os.environ.get("INGEST_WORKERS", "1")),
+    max_pending=int(os.environ.get("INGEST_MAX_QUEUED", "16")),
+)
+
+# Upload/search notifications are posted to the webhook in the background
+notifications = NotificationDispatcher(
+    lambda payload: _post_to_webhook(payload),
+    max_queue=int(os.environ.get("NOTIFY_MAX_QUEUED", "256")),
+    batch_size=int(os.environ.get("NOTIFY_BATCH_SIZE", "1")),
+    drop_policy=os.environ.get("NOTIFY_DROP_POLICY", "oldest"),
+)
 
 def _config_defaults() -> Dict[str, Any]:
     return {}
@@ -40,138 +77,68 @@ def _get_webhook_url() -> str | None:
 
 def _post_to_webhook(payload: Dict[str, Any]) -> Dict[str, Any]:
     url = _get_webhook_url()
-    print(f"DEBUG: _post_to_webhook called with URL: {url}")
-    print(f"DEBUG: Payload: {payload}")
-    
     if not url:
-        print("ERROR: WEBHOOK_URL not set in environment variables")
+        log.error("WEBHOOK_URL not set in environment variables")
         return {"posted": False, "reason": "WEBHOOK_URL not set"}
     
     try:
-        print(f"DEBUG: Sending POST request to: {url}")
-        print(f"DEBUG: Request payload: {json.dumps(payload, indent=2)}")
-        
-        resp = requests.post(url, json=payload, timeout=30)
+        log.debug("Sending %s to webhook: %s", payload.get("event"), truncate(payload))
+        resp = get_webhook_client().post(url, payload)
         result = {"posted": True, "status_code": resp.status_code}
-        
-        print(f"DEBUG: Response status code: {resp.status_code}")
-        print(f"DEBUG: Response headers: {dict(resp.headers)}")
-        print(f"DEBUG: Response text: {resp.text}")
+        log.debug("Webhook returned %s: %s", resp.status_code, truncate(resp.text))
         
         # For chat messages, try to get the response content
         if payload.get("event") == "chat_message" and resp.status_code == 200:
             try:
                 response_data = resp.json()
                 result["response"] = response_data
-                print(f"DEBUG: Parsed JSON response: {response_data}")
-            except Exception as json_error:
-                print(f"DEBUG: JSON parsing failed: {json_error}")
+            except Exception:
                 # If JSON parsing fails, try to extract text response
                 response_text = resp.text.strip()
                 if response_text:
                     result["response"] = {"message": response_text}
-                    print(f"DEBUG: Using text response: {response_text}")
                 else:
                     result["response"] = {"message": "Response received but no content"}
-                    print("DEBUG: Webhook returned empty response")
-        else:
-            print(f"DEBUG: Not a chat message or non-200 status: event={payload.get('event')}, status={resp.status_code}")
-        
+                    log.warning("Webhook returned empty response")
+
         return result
     except requests.exceptions.Timeout as e:
-        print(f"ERROR: Webhook request timed out: {str(e)}")
+        log.error("Webhook request timed out: %s", e)
         return {"posted": False, "error": f"Request timeout: {str(e)}"}
     except requests.exceptions.ConnectionError as e:
-        print(f"ERROR: Webhook connection failed: {str(e)}")
+        log.error("Webhook connection failed: %s", e)
         return {"posted": False, "error": f"Connection error: {str(e)}"}
     except requests.exceptions.RequestException as e:
-        print(f"ERROR: Webhook request failed: {str(e)}")
+        log.error("Webhook request failed: %s", e)
         return {"posted": False, "error": f"Request error: {str(e)}"}
     except Exception as e:
-        print(f"ERROR: Unexpected error in webhook request: {str(e)}")
+        log.exception("Unexpected error in webhook request")
         return {"posted": False, "error": str(e)}
 
 
-def _poll_for_ai_response(request_id: str, max_attempts: int = 30, delay: int = 2) -> Dict[str, Any] | None:
-    """Poll for AI response using the request_id"""
-    print(f"DEBUG: Polling for AI response with request_id: {request_id}")
-    
-    for attempt in range(max_attempts):
-        print(f"DEBUG: Polling attempt {attempt + 1}/{max_attempts}")
-        
-        if request_id in ai_responses:
-            response = ai_responses.pop(request_id)  # Remove from storage after retrieval
-            print(f"DEBUG: Found AI response: {response}")
-            return response
-        
-        time.sleep(delay)
-    
-    print(f"DEBUG: Polling timeout after {max_attempts} attempts")
-    return None
+def _notify_webhook(payload: Dict[str, Any], coalesce_key: str) -> Dict[str, Any]:
+    """Posts payload synchronously with ?wait_webhook=true, otherwise queues it and returns at once."""
+    if request.args.get("wait_webhook", "false").lower() == "true":
+        return _post_to_webhook(payload)
+    return {"queued": notifications.notify(payload, coalesce_key)}
 
 
-def _convert_base64_to_images(images: Dict[str, str]) -> Dict[str, str]:
-    """Convert base64 images to actual image files and return file paths"""
-    if not images:
-        print("No images to convert")
-        return {}
-    
-    print(f"Converting {len(images)} images...")
-    
-    # Create permanent images directory
-    images_dir = os.path.join("static", "images")
-    os.makedirs(images_dir, exist_ok=True)
-    
-    image_paths = {}
-    
-    try:
-        for image_id, base64_data in images.items():
-            print(f"Processing image: {image_id}")
-            # Remove data URL prefix if present
-            if base64_data.startswith('data:image/png;base64,'):
-                base64_data = base64_data.split(',', 1)[1]
-            elif base64_data.startswith('data:image/'):
-                # Handle other image formats
-                base64_data = base64_data.split(',', 1)[1]
-            
-            # Decode base64 to bytes
-            try:
-                image_bytes = base64.b64decode(base64_data)
-                print(f"Decoded {len(image_bytes)} bytes for {image_id}")
-            except Exception as e:
-                print(f"Failed to decode base64 for {image_id}: {e}")
-                continue
-            
-            # Create image file in permanent directory
-            image_filename = f"{image_id}.png"
-            image_path = os.path.join(images_dir, image_filename)
-            
-            with open(image_path, 'wb') as f:
-                f.write(image_bytes)
-            
-            # Store relative path for serving
-            image_paths[image_id] = f"/static/images/{image_filename}"
-            print(f"Created image file: {image_path}")
-            
-        print(f"Successfully converted {len(image_paths)} images")
-        return image_paths
-        
-    except Exception as e:
-        print(f"Error in _convert_base64_to_images: {str(e)}")
-        raise e
+def _wait_for_ai_response(request_id: str, timeout: float = AI_RESPONSE_TIMEOUT) -> Dict[str, Any] | None:
+    """Block until /webhook_response delivers the AI response for request_id, or timeout"""
+    log.debug("Waiting up to %ss for AI response with request_id %s", timeout, request_id)
+    with metrics.STAGE_SECONDS.time(stage="ai_response_wait"):
+        response = ai_responses.wait(request_id, timeout)
+    if response is None:
+        metrics.AI_RESPONSE_TIMEOUTS.inc()
+        log.warning("Timed out after %ss waiting for AI response to %s", timeout, request_id)
+    else:
+        log.debug("Found AI response: %s", truncate(response))
+    return response
 
 
-def _cleanup_temp_images():
-    """Clean up old temporary image directories"""
-    temp_base = tempfile.gettempdir()
-    for item in os.listdir(temp_base):
-        if item.startswith("recall_me_images_"):
-            item_path = os.path.join(temp_base, item)
-            if os.path.isdir(item_path):
-                try:
-                    shutil.rmtree(item_path)
-                except Exception:
-                    pass  # Ignore cleanup errors
+def _image_urls(image_refs: Dict[str, str]) -> Dict[str, str]:
+    """image_id -> URL of the stored PNG, served by /images/<sha>.png"""
+    return {image_id: f"/images/{sha}.png" for image_id, sha in image_refs.items()}
 
 
 @app.route("/")
@@ -187,28 +154,21 @@ def library() -> str:
 @app.route("/chat", methods=["POST"])
 def chat_with_agent() -> Any:
     """Handle AI agent chat messages via webhook with polling for response"""
-    print("DEBUG: /chat route called")
     try:
         data = request.get_json()
-        print(f"DEBUG: Received data: {data}")
-        
+        log.debug("Received data: %s", truncate(data))
+
         if not data or "message" not in data:
-            print("ERROR: Missing message in request data")
             return jsonify({"error": "Missing message"}), 400
         
         message = data["message"].strip()
         if not message:
-            print("ERROR: Empty message")
             return jsonify({"error": "Empty message"}), 400
         
-        print(f"DEBUG: Processing message: '{message}'")
-        
         # Check if webhook URL is configured
         webhook_url = _get_webhook_url()
-        print(f"DEBUG: Webhook URL from environment: {webhook_url}")
-        
         if not webhook_url:
-            print("ERROR: WEBHOOK_URL not configured")
+            log.error("WEBHOOK_URL not configured")
             return jsonify({
                 "error": "AI agent webhook not configured. Please set WEBHOOK_URL environment variable."
             }), 500
@@ -225,16 +185,16 @@ def chat_with_agent() -> Any:
             "request_id": request_id
         }
         
-        print(f"DEBUG: Prepared payload: {payload}")
+        # Register before sending so a fast /webhook_response is not missed
+        ai_responses.register(request_id)
         
         # Send to webhook and get response
-        print("DEBUG: Calling _post_to_webhook...")
+        log.info("Sending chat %s to AI agent", request_id)
         webhook_result = _post_to_webhook(payload)
         
-        print(f"DEBUG: Webhook result: {webhook_result}")
-        
         if not webhook_result.get("posted"):
-            print("ERROR: Webhook post failed")
+            log.error("Webhook post failed for chat %s: %s", request_id, truncate(webhook_result))
+            ai_responses.discard(request_id)
             return jsonify({
                 "error": "Failed to send message to AI agent",
                 "details": webhook_result
@@ -244,9 +204,9 @@ def chat_with_agent() -> Any:
         response_data = webhook_result.get("response", {})
         
         if response_data.get("message") == "Workflow was started":
-            # Workflow started but no AI response yet - implement polling
-            print("DEBUG: Workflow started, implementing polling for AI response...")
-            ai_response = _poll_for_ai_response(request_id, max_attempts=30, delay=2)
+            # Workflow started but no AI response yet - wait for /webhook_response
+            log.debug("Workflow started, waiting for AI response to %s", request_id)
+            ai_response = _wait_for_ai_response(request_id)
             
             if ai_response:
                 return jsonify({
@@ -267,6 +227,7 @@ def chat_with_agent() -> Any:
                 })
         else:
             # Got immediate response from AI agent
+            ai_responses.discard(request_id)
             return jsonify({
                 "status": "success",
                 "webhook_response": webhook_result,
@@ -275,44 +236,34 @@ def chat_with_agent() -> Any:
             })
         
     except Exception as e:
-        print(f"ERROR: Exception in chat_with_agent: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Exception in chat_with_agent")
         return jsonify({"error": str(e)}), 500
 
 
 @app.route("/ai_chat", methods=["POST"])
 def ai_chat_with_rag() -> Any:
     """Handle AI agent chat with RAG context - called by extension"""
-    print("DEBUG: /ai_chat route called")
     try:
         data = request.get_json()
-        print(f"DEBUG: Received data: {data}")
-        
+        log.debug("Received data: %s", truncate(data))
+
         if not data or "query" not in data:
-            print("ERROR: Missing query in request data")
             return jsonify({"error": "Missing query"}), 400
         
         query = data["query"].strip()
         if not query:
-            print("ERROR: Empty query")
             return jsonify({"error": "Empty query"}), 400
         
-        print(f"DEBUG: Processing query: '{query}'")
-        
         # Check if webhook URL is configured
         webhook_url = _get_webhook_url()
-        print(f"DEBUG: Webhook URL from environment: {webhook_url}")
-        
         if not webhook_url:
-            print("ERROR: WEBHOOK_URL not configured")
+            log.error("WEBHOOK_URL not configured")
             return jsonify({
                 "error": "AI agent webhook not configured. Please set WEBHOOK_URL environment variable."
             }), 500
         
         # Get RAG context if provided
         rag_context = data.get("rag_context", {})
-        print(f"DEBUG: RAG context: {rag_context}")
         
         # Generate a unique request ID for tracking
         request_id = str(uuid.uuid4())
@@ -327,16 +278,16 @@ def ai_chat_with_rag() -> Any:
             "rag_context": rag_context
         }
         
-        print(f"DEBUG: Prepared payload: {payload}")
+        # Register before sending so a fast /webhook_response is not missed
+        ai_responses.register(request_id)
         
         # Send to webhook and get response
-        print("DEBUG: Calling _post_to_webhook...")
+        log.info("Sending chat %s to AI agent", request_id)
         webhook_result = _post_to_webhook(payload)
         
-        print(f"DEBUG: Webhook result: {webhook_result}")
-        
         if not webhook_result.get("posted"):
-            print("ERROR: Webhook post failed")
+            log.error("Webhook post failed for chat %s: %s", request_id, truncate(webhook_result))
+            ai_responses.discard(request_id)
             return jsonify({
                 "error": "Failed to send message to AI agent",
                 "details": webhook_result
@@ -346,9 +297,9 @@ def ai_chat_with_rag() -> Any:
         response_data = webhook_result.get("response", {})
         
         if response_data.get("message") == "Workflow was started":
-            # Workflow started but no AI response yet - implement polling
-            print("DEBUG: Workflow started, implementing polling for AI response...")
-            ai_response = _poll_for_ai_response(request_id, max_attempts=30, delay=2)
+            # Workflow started but no AI response yet - wait for /webhook_response
+            log.debug("Workflow started, waiting for AI response to %s", request_id)
+            ai_response = _wait_for_ai_response(request_id)
             
             if ai_response:
                 return jsonify({
@@ -365,6 +316,7 @@ def ai_chat_with_rag() -> Any:
                 })
         else:
             # Got immediate response from AI agent
+            ai_responses.discard(request_id)
             return jsonify({
                 "status": "success",
                 "ai_response": response_data,
@@ -373,9 +325,7 @@ def ai_chat_with_rag() -> Any:
             })
         
     except Exception as e:
-        print(f"ERROR: Exception in ai_chat_with_rag: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Exception in ai_chat_with_rag")
         return jsonify({"error": str(e)}), 500
 
 
@@ -384,21 +334,21 @@ def webhook_response() -> Any:
     """Handle responses from n8n webhook (respond to webhook node)"""
     try:
         data = request.get_json()
-        print(f"DEBUG: Received webhook response: {data}")
+        log.debug("Received webhook response: %s", truncate(data))
         
         # Extract request_id from the response
         request_id = data.get("request_id")
         if request_id:
-            # Store the AI response for polling
-            ai_responses[request_id] = data
-            print(f"DEBUG: Stored AI response for request_id: {request_id}")
-            return jsonify({"status": "received", "message": "Response stored for polling"})
+            # Wake the request waiting for this response
+            ai_responses.deliver(request_id, data)
+            log.info("Delivered AI response for request_id %s", request_id)
+            return jsonify({"status": "received", "message": "Response delivered"})
         else:
-            print("WARNING: No request_id in webhook response")
+            log.warning("No request_id in webhook response")
             return jsonify({"status": "received", "message": "Response processed but no request_id"})
         
     except Exception as e:
-        print(f"ERROR: Error processing webhook response: {str(e)}")
+        log.exception("Error processing webhook response")
         return jsonify({"error": str(e)}), 500
 
 
@@ -411,7 +361,24 @@ def get_webhook_url() -> Any:
 
 @app.route("/health")
 def health() -> Any:
-    return jsonify({"status": "ok"})
+    status = index_status()
+    return jsonify(
+        {
+            "status": "ok",
+            # Queries work once an index is published; the model loads on first use
+            "ready": status["vectors"] > 0,
+            "index": status,
+            "query_cache": query_cache_stats(),
+            "pending_responses": ai_responses.stats(),
+            "webhook": get_webhook_client().stats(),
+            "notifications": notifications.stats(),
+        }
+    )
+
+
+@app.route("/metrics")
+def metrics_endpoint() -> Any:
+    return metrics.render(), 200, {"Content-Type": metrics.CONTENT_TYPE}
 
 
 @app.route("/reset", methods=["POST"])  # dev only
@@ -460,28 +427,182 @@ def upload_langchain() -> Any:
     file = request.files["file"]
     if file.filename == "":
         return jsonify({"error": "No selected file"}), 400
-    pdf_path = os.path.join(paths["uploads"], file.filename)
+    file_name = secure_filename(file.filename) or "document.pdf"
+    # Unique per upload, so concurrent uploads of the same name don't overwrite
+    # each other; removed once ingestion is over
+    pdf_path = os.path.join(paths["uploads"], f"{uuid.uuid4().hex}_{file_name}")
     file.save(pdf_path)
-    stats = build_unified_index(pdf_path)
-    payload = {"event": "upload_lc", "file": os.path.basename(pdf_path), **stats}
-    webhook_result = _post_to_webhook(payload)
-    return jsonify({"status": "ok", **stats, "webhook": webhook_result})
+    # Appends to the existing index; re-uploading a document replaces it
+    doc_id = request.form.get("doc_id") or None
+    incremental = request.form.get("incremental", "true").lower() != "false"
+    if request.args.get("wait", request.form.get("wait", "false")).lower() == "true":
+        # Old behaviour: ingest inside the request
+        try:
+            return jsonify({"status": "ok", **_ingest_pdf(pdf_path, file_name, doc_id, incremental)})
+        finally:
+            _remove_upload(pdf_path)
+    try:
+        job = ingest_jobs.submit(
+            file_name,
+            lambda job: _ingest_pdf(pdf_path, file_name, doc_id, incremental, job.progress),
+            cleanup=lambda: _remove_upload(pdf_path),
+        )
+    except QueueFull as e:
+        _remove_upload(pdf_path)
+        return jsonify({"error": f"Ingestion queue is full: {e}"}), 429
+    return jsonify({"status": "queued", "status_url": f"/jobs/{job.id}", **job.to_dict()}), 202
+
+
+def _remove_upload(pdf_path: str) -> None:
+    try:
+        os.remove(pdf_path)
+    except OSError:
+        pass
+
+
+def _ingest_pdf(
+    pdf_path: str, file_name: str, doc_id: str | None, incremental: bool, progress=None
+) -> Dict[str, Any]:
+    stats = build_unified_index(
+        pdf_path, doc_id=doc_id, incremental=incremental, progress=progress, file_name=file_name
+    )
+    payload = {"event": "upload_lc", "file": file_name, **stats}
+    # Runs on a job thread too, so never block on the webhook here
+    webhook_result = {"queued": notifications.notify(payload, f"upload_lc:{stats.get('doc_id')}")}
+    return {**stats, "webhook": webhook_result}
+
+
+@app.route("/jobs", methods=["GET"])
+def jobs_list() -> Any:
+    return jsonify({"jobs": [job.to_dict() for job in ingest_jobs.list()]})
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id: str) -> Any:
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/jobs/<job_id>", methods=["DELETE"])
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def job_cancel(job_id: str) -> Any:
+    job = ingest_jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job: {job_id}"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/documents", methods=["GET"])
+def documents_list() -> Any:
+    return jsonify({"documents": list_documents()})
+
+
+@app.route("/documents/<doc_id>", methods=["DELETE"])
+def documents_delete(doc_id: str) -> Any:
+    result = delete_document(doc_id)
+    if not result["found"]:
+        return jsonify({"error": f"Unknown document: {doc_id}"}), 404
+    return jsonify({"status": "ok", **result})
+
+
+def _k_arg(value: Any) -> int:
+    """Requested number of hits, clamped to SEARCH_K_MAX. Raises ValueError unless it is an integer >= 1."""
+    k = int(value)
+    if k < 1:
+        raise ValueError(f"k must be at least 1, got {k}")
+    return min(k, SEARCH_K_MAX)
+
+
+def _image_neighbourhood_arg() -> int | None:
+    """Optional ?image_neighbourhood=n: also return images within n pages of each hit."""
+    value = request.args.get("image_neighbourhood")
+    if value is None or value == "":
+        return None
+    try:
+        return max(0, int(value))
+    except ValueError:
+        return None
+
+
+def _ann_search_args() -> Dict[str, int]:
+    """Optional ?nprobe= (IVF) and ?ef_search= (HNSW) to trade recall for latency per query."""
+    args = {}
+    for name in ("nprobe", "ef_search"):
+        try:
+            value = int(request.args.get(name, ""))
+        except ValueError:
+            continue
+        if value > 0:
+            args[name] = value
+    return args
+
+
+def _hybrid_arg() -> bool | None:
+    """Optional ?hybrid=true|false: fuse BM25 keyword hits with CLIP hits (default HYBRID_SEARCH, off)."""
+    value = request.args.get("hybrid", "").lower()
+    if value in ("true", "false"):
+        return value == "true"
+    return None
+
+
+def _search_filter_arg() -> SearchFilter | None:
+    """
+    Optional filters, combined with AND: ?doc_id= and ?type=text|image (both
+    repeatable), ?page_min= / ?page_max= (inclusive, numbered as in hit
+    metadata). Raises ValueError for page numbers that are not integers.
+    """
+    pages = {}
+    for name in ("page_min", "page_max"):
+        value = request.args.get(name, "").strip()
+        pages[name] = int(value) if value else None
+    search_filter = SearchFilter(
+        doc_ids=tuple(v for v in request.args.getlist("doc_id") if v),
+        types=tuple(v for v in request.args.getlist("type") if v),
+        **pages,
+    )
+    return search_filter if search_filter.active() else None
+
+
+def _search_args() -> Dict[str, Any]:
+    """
+    search_unified_lc keyword arguments from the optional query parameters
+    above. Raises ValueError like _search_filter_arg.
+    """
+    return {
+        "image_neighbourhood": _image_neighbourhood_arg(),
+        "hybrid": _hybrid_arg(),
+        "search_filter": _search_filter_arg(),
+        **_ann_search_args(),
+    }
+
+
+def _search_coalesce_key(event: str, query: str, k: int, search_args: Dict[str, Any]) -> str:
+    """Notifications coalesce only when every argument that shapes the results is equal."""
+    return json.dumps([event, query, k, search_args], sort_keys=True)
 
 
 @app.route("/search_lc", methods=["GET"])
 def search_langchain() -> Any:
     query = request.args.get("query", "").strip()
-    k = int(request.args.get("k", "5"))
     ai_only = request.args.get("ai_only", "false").lower() == "true"
     
     if not query:
         return jsonify({"error": "Missing query"}), 400
+    try:
+        k = _k_arg(request.args.get("k", "5"))
+    except ValueError:
+        return jsonify({"error": "k must be a positive integer"}), 400
+    try:
+        search_args = _search_args()
+    except ValueError:
+        return jsonify({"error": "page_min and page_max must be integers"}), 400
     
-    print(f"DEBUG: Search request - query: {query}, k: {k}, ai_only: {ai_only}")
+    log.debug("Search request: query=%s k=%d ai_only=%s", truncate(query), k, ai_only)
     
     # If AI only mode, skip RAG processing and go straight to webhook
     if ai_only:
-        print("DEBUG: AI-only mode - skipping RAG search")
         # Create minimal payload for webhook
         payload = {"event": "search_lc", "query": query, "k": k}
         webhook_result = _post_to_webhook(payload)
@@ -490,55 +611,33 @@ def search_langchain() -> Any:
         ai_response = None
         if webhook_result.get("response"):
             ai_response = webhook_result["response"]
-            print(f"DEBUG: AI response found in webhook result: {ai_response}")
         
         # Return only AI response and webhook info
         result = {"hits": [], "images": {}, "image_paths": {}, "webhook": webhook_result}
         if ai_response:
             result["ai_response"] = ai_response
-            print(f"DEBUG: Added AI response to result")
         
         return jsonify(result)
     
     # Normal RAG processing
-    # Clean up old temp images first
-    _cleanup_temp_images()
+    res = search_unified_lc(query, k, **search_args)
+    log.debug("Search returned %d hits, %d images", len(res.get("hits", [])), len(res.get("images") or {}))
     
-    res = search_unified_lc(query, k)
-    
-    # Debug: log the exact response structure
-    print(f"Search response keys: {list(res.keys())}")
-    print(f"Number of hits: {len(res.get('hits', []))}")
-    print(f"Images object type: {type(res.get('images'))}")
-    print(f"Images object keys: {list(res.get('images', {}).keys()) if res.get('images') else 'None'}")
-    
-    # Convert base64 images to actual files
-    if res.get("images"):
-        try:
-            print(f"Converting {len(res['images'])} images to files...")
-            image_paths = _convert_base64_to_images(res["images"])
-            res["image_paths"] = image_paths
-            print(f"Created {len(image_paths)} image files in static/images/")
-        except Exception as e:
-            print(f"Error converting images: {str(e)}")
-            return jsonify({"error": f"Failed to convert images: {str(e)}"}), 500
-    else:
-        print("No images found in response")
+    # Images were written once at ingestion; just point at them
+    res["image_paths"] = _image_urls(res.pop("image_refs", {}))
     
     payload = {"event": "search_lc", "query": query, "k": k, **res}
-    webhook_result = _post_to_webhook(payload)
+    webhook_result = _notify_webhook(payload, _search_coalesce_key("search_lc", query, k, search_args))
     
     # Check if webhook result contains AI response
     ai_response = None
     if webhook_result.get("response"):
         ai_response = webhook_result["response"]
-        print(f"DEBUG: AI response found in webhook result: {ai_response}")
     
     # Return both RAG results and AI response if available
     result = {**res, "webhook": webhook_result}
     if ai_response:
         result["ai_response"] = ai_response
-        print(f"DEBUG: Added AI response to search result")
     
     return jsonify(result)
 
@@ -546,29 +645,75 @@ def search_langchain() -> Any:
 @app.route("/search_lc_page", methods=["GET"])
 def search_langchain_page() -> Any:
     query = request.args.get("query", "").strip()
-    k = int(request.args.get("k", "5"))
     if not query:
         return jsonify({"error": "Missing query"}), 400
+    try:
+        k = _k_arg(request.args.get("k", "5"))
+    except ValueError:
+        return jsonify({"error": "k must be a positive integer"}), 400
+    try:
+        search_args = _search_args()
+    except ValueError:
+        return jsonify({"error": "page_min and page_max must be integers"}), 400
     
-    # Clean up old temp images first
-    _cleanup_temp_images()
-    
-    res = search_unified_lc(query, k)
-    
-    # Convert base64 images to actual files
-    if res.get("images"):
-        try:
-            image_paths = _convert_base64_to_images(res["images"])
-            res["image_paths"] = image_paths
-        except Exception as e:
-            return jsonify({"error": f"Failed to convert images: {str(e)}"}), 500
+    res = search_unified_lc(query, k, **search_args)
+    res["image_paths"] = _image_urls(res.pop("image_refs", {}))
     
     payload = {"event": "search_lc_page", "query": query, "k": k, **res}
-    webhook_result = _post_to_webhook(payload)
+    webhook_result = _notify_webhook(payload, _search_coalesce_key("search_lc_page", query, k, search_args))
     return jsonify({**res, "webhook": webhook_result})
 
 
-# Images are now served from static/images/ via Flask's static file serving
+@app.route("/search_lc/batch", methods=["POST"])
+def search_langchain_batch() -> Any:
+    """
+    Body {"queries": [...], "k": 5}; returns {"results": [...]} in query order.
+    All queries share one CLIP call and one FAISS search. Meant for dashboards
+    and bulk evaluation, so no webhook notification is sent.
+    """
+    data = request.get_json(silent=True) or {}
+    queries = data.get("queries")
+    if not isinstance(queries, list) or not queries or not all(isinstance(q, str) and q.strip() for q in queries):
+        return jsonify({"error": "queries must be a non-empty list of non-empty strings"}), 400
+    if len(queries) > SEARCH_BATCH_MAX:
+        return jsonify({"error": f"At most {SEARCH_BATCH_MAX} queries per batch"}), 400
+    try:
+        k = _k_arg(data.get("k", request.args.get("k", "5")))
+    except (TypeError, ValueError):
+        return jsonify({"error": "k must be a positive integer"}), 400
+    try:
+        search_args = _search_args()
+    except ValueError:
+        return jsonify({"error": "page_min and page_max must be integers"}), 400
+
+    queries = [q.strip() for q in queries]
+    log.debug("Batch search request: %d queries k=%d", len(queries), k)
+    results = search_unified_lc_batch(queries, k, **search_args)
+    for query, res in zip(queries, results):
+        res["query"] = query
+        res["image_paths"] = _image_urls(res.pop("image_refs", {}))
+    return jsonify({"results": results})
+
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+IMAGE_MAX_AGE = 365 * 24 * 3600
+
+
+@app.route("/images/<sha>.png")
+def stored_image(sha: str) -> Any:
+    """
+    Serves an ingested image from the content-addressed image store. The
+    name is the content hash, so the ETag never changes and clients may cache
+    it forever; If-None-Match / If-Modified-Since get a 304.
+    """
+    if not _SHA256_RE.match(sha):
+        abort(404)
+    response = send_from_directory(
+        image_store.IMAGES_DIR, f"{sha}.png", mimetype="image/png", etag=sha, max_age=IMAGE_MAX_AGE
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 
 @app.route("/cleanup_images", methods=["POST"])
@@ -641,34 +786,23 @@ def generate_document_preview():
 def get_document_info():
     """Get information about indexed documents"""
     try:
-        data_dir = os.path.join("data", "index", "langchain")
-        image_data_json = os.path.join(data_dir, "image_data.json")
-        
-        if not os.path.exists(image_data_json):
-            return jsonify({"documents": []})
-        
-        with open(image_data_json, "r", encoding="utf-8") as f:
-            image_data = json.load(f)
-        
-        # Extract document information from image data
-        documents = {}
-        for image_id, _ in image_data.items():
-            if image_id.startswith("page_"):
-                parts = image_id.split("_")
-                if len(parts) >= 3:
-                    page_num = int(parts[1])
-                    if page_num not in documents:
-                        documents[page_num] = {
-                            "page": page_num,
-                            "image_count": 0,
-                            "images": []
-                        }
-                    documents[page_num]["image_count"] += 1
-                    documents[page_num]["images"].append(image_id)
+        # Served from the resident index snapshot rather than re-reading disk
+        image_urls = _image_urls(get_image_refs())
+        entries = list_documents()
+        documents = []
+        for (doc_id, page_num), image_ids in get_page_images().items():
+            documents.append({
+                "doc_id": doc_id,
+                "file": entries.get(doc_id, {}).get("file") if doc_id is not None else None,
+                "page": page_num,
+                "image_count": len(image_ids),
+                "images": list(image_ids),
+                "image_urls": [image_urls[i] for i in image_ids if i in image_urls]
+            })
         
         # Convert to list and sort by page number
-        document_list = list(documents.values())
-        document_list.sort(key=lambda x: x["page"])
+        document_list = documents
+        document_list.sort(key=lambda x: (x["doc_id"] or "", x["page"]))
         
         return jsonify({"documents": document_list})
         
@@ -681,12 +815,11 @@ if __name__ == "__main__":
     load_dotenv()
     ensure_dirs()
     
-    # Print webhook URL status for debugging
     webhook_url = _get_webhook_url()
     if webhook_url:
-        print(f"Webhook URL configured: {webhook_url}")
+        log.info("Webhook URL configured: %s", webhook_url)
     else:
-        print("Warning: WEBHOOK_URL not set in environment variables")
+        log.warning("WEBHOOK_URL not set in environment variables")
     
     app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)), debug=True)
 
@@ -0,0 +1,101 @@
+"""
+Recall-vs-latency benchmark of the FAISS index types build_unified_index can
+use (FAISS_INDEX_TYPE), against the exact flat baseline on the same data.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_ann [--n 100000] [--queries 500] [--k 10] [--types hnsw,ivf_flat,ivf_pq]
+
+Vectors are a synthetic clustered, L2-normalized 512-d corpus shaped like CLIP
+embeddings; queries are perturbed corpus points. For each index type and each
+nprobe / efSearch setting it reports build time, index size, single-query
+latency (p50/p99) and recall@k against exact search.
+"""
+
+import argparse
+import time
+from typing import Dict, List, Tuple
+
+import faiss
+import numpy as np
+
+from services import ann_index
+
+
+def synthetic_corpus(n: int, dim: int, n_queries: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, n // 500), dim)).astype("float32")
+    assign = rng.integers(0, len(centers), size=n)
+    corpus = centers[assign] + 0.6 * rng.standard_normal((n, dim)).astype("float32")
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+    picks = rng.integers(0, n, size=n_queries)
+    queries = corpus[picks] + 0.05 * rng.standard_normal((n_queries, dim)).astype("float32")
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return corpus, queries
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def time_queries(search, queries: np.ndarray, k: int) -> Tuple[np.ndarray, List[float]]:
+    """One query per call, as the search endpoint issues them."""
+    results = np.empty((len(queries), k), dtype="int64")
+    latencies = []
+    for i, q in enumerate(queries):
+        start = time.perf_counter()
+        _, ids = search(q[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        results[i] = ids[0]
+    return results, latencies
+
+
+def report(name: str, build_s: float, size_mb: float, latencies: List[float], recall: float) -> None:
+    p50, p99 = np.percentile(np.array(latencies) * 1000, [50, 99])
+    print(f"{name:<28} build {build_s:7.2f}s  size {size_mb:8.1f} MB  p50 {p50:7.3f} ms  p99 {p99:7.3f} ms  recall {recall:.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=100000, help="corpus vectors")
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", default="hnsw,ivf_flat,ivf_pq")
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads (1 = per-request cost)")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    corpus, queries = synthetic_corpus(args.n, args.dim, args.queries)
+    print(f"{args.n} x {args.dim} corpus, {args.queries} queries, k={args.k}, {args.threads} thread(s)")
+
+    start = time.perf_counter()
+    flat = faiss.IndexFlatL2(args.dim)
+    flat.add(corpus)
+    flat_build = time.perf_counter() - start
+    truth, latencies = time_queries(flat.search, queries, args.k)
+    report("flat (exact)", flat_build, corpus.nbytes / 2**20, latencies, 1.0)
+
+    sweeps: Dict[str, Tuple[str, List[int]]] = {
+        "hnsw": ("ef_search", [16, 32, 64, 128, 256]),
+        "ivf_flat": ("nprobe", [1, 4, 16, 64]),
+        "ivf_pq": ("nprobe", [1, 4, 16, 64]),
+    }
+    # Always build, whatever ANN_MIN_VECTORS says
+    ann_index.ANN_MIN_VECTORS = 0
+    for index_type in [t.strip() for t in args.types.split(",") if t.strip()]:
+        start = time.perf_counter()
+        ann = ann_index.build(corpus, index_type)
+        build_s = time.perf_counter() - start
+        size_mb = len(faiss.serialize_index(ann.index)) / 2**20
+        param, values = sweeps[index_type]
+        for value in values:
+            found, latencies = time_queries(
+                lambda q, k: ann_index.search(ann, q, k, **{param: value}), queries, args.k
+            )
+            report(f"{index_type} {param}={value}", build_s, size_mb, latencies, recall_at_k(found, truth))
+
+
+if __name__ == "__main__":
+    main()
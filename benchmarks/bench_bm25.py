@@ -0,0 +1,102 @@
+"""
+Latency benchmark of BM25 keyword retrieval and its reciprocal rank fusion
+with the CLIP ranking, as used by hybrid search (hybrid=true / HYBRID_SEARCH).
+
+Usage (from the repository root):
+    python -m benchmarks.bench_bm25 [--n 1000000] [--queries 500] [--k 10] [--budget-ms 50]
+
+The corpus is n synthetic chunks of Zipf-distributed words (about the token
+count of a 500-character chunk), ingested in --batches increments the way
+documents arrive. Queries are 1-4 words drawn from the same distribution, so
+most contain at least one very common term. The CLIP side is a random
+ranking of the same depth: only the fusion cost matters here, FAISS latency
+is covered by bench_ann. The run fails (exit 1) when the fused p95 exceeds
+--budget-ms.
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from typing import Any, List
+
+import numpy as np
+
+from services import bm25_index
+from services import langchain_pipeline as pipeline
+
+
+def zipf_words(shape: Any, vocabulary: int, rng: np.random.Generator) -> np.ndarray:
+    """Word ids with P(w_i) proportional to 1 / (i + 1), like natural-language text."""
+    weights = 1.0 / np.arange(1, vocabulary + 1)
+    return rng.choice(vocabulary, size=shape, p=weights / weights.sum())
+
+
+def synthetic_chunks(n: int, vocabulary: int, words: int, rng: np.random.Generator) -> List[str]:
+    return [" ".join(f"w{i}" for i in row) for row in zipf_words((n, words), vocabulary, rng)]
+
+
+def percentiles(latencies: List[float]) -> str:
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    return f"p50 {p50:7.3f} ms  p95 {p95:7.3f} ms  p99 {p99:7.3f} ms"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=1000000, help="corpus chunks")
+    parser.add_argument("--vocabulary", type=int, default=50000)
+    parser.add_argument("--words", type=int, default=80, help="words per chunk")
+    parser.add_argument("--batches", type=int, default=10, help="incremental ingestion steps")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="p95 budget for BM25 + fusion")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    index = bm25_index.empty()
+    step = max(1, args.n // args.batches)
+    merge_s = 0.0
+    for start in range(0, args.n, step):
+        texts = synthetic_chunks(min(step, args.n - start), args.vocabulary, args.words, rng)
+        begin = time.perf_counter()
+        index = bm25_index.add(index, texts)
+        merge_s += time.perf_counter() - begin
+    print(
+        f"{index.count} chunks, {len(index.terms)} terms, {len(index.positions)} postings; "
+        f"indexed in {args.batches} incremental batches, {merge_s:.1f}s"
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        begin = time.perf_counter()
+        bm25_index.write(index, f"{tmp}/bm25")
+        written = time.perf_counter() - begin
+        begin = time.perf_counter()
+        index = bm25_index.load(f"{tmp}/bm25")
+        print(f"write {written:.2f}s, memory-mapped load {1000 * (time.perf_counter() - begin):.1f} ms")
+
+        queries = [
+            " ".join(f"w{i}" for i in zipf_words(rng.integers(1, 5), args.vocabulary, rng))
+            for _ in range(args.queries)
+        ]
+        depth = args.k * max(1, pipeline.HYBRID_CANDIDATES)
+        bm25_latencies, fused_latencies = [], []
+        for query in queries:
+            dense = rng.integers(0, index.count, size=depth)
+            begin = time.perf_counter()
+            _, lexical = bm25_index.search(index, query, depth)
+            bm25_latencies.append(time.perf_counter() - begin)
+            pipeline._hybrid_ranking(None, dense, lexical, args.k)
+            fused_latencies.append(time.perf_counter() - begin)
+        # tempfile cleanup needs the maps closed
+        del index
+
+    p95 = np.percentile(np.array(fused_latencies) * 1000, 95)
+    print(f"{'bm25 top-' + str(depth):<20} {percentiles(bm25_latencies)}")
+    print(f"{'bm25 + rrf fusion':<20} {percentiles(fused_latencies)}")
+    print(f"p95 {p95:.3f} ms vs budget {args.budget_ms:.1f} ms: {'PASS' if p95 <= args.budget_ms else 'FAIL'}")
+    if p95 > args.budget_ms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Memory / latency / recall benchmark of compressed candidate search
+(VECTOR_COMPRESSION=fp16|int8) with exact float32 re-ranking, against the
+uncompressed float32 store on the same data.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_compression [--n 100000] [--queries 500] [--k 10] [--index-type flat] [--factors 1,2,4,8]
+
+Uses the synthetic corpus of bench_ann. The float32 vectors for re-ranking
+are written to a temporary .npy and memory-mapped, as a published generation
+does. "resident" is the size of the compressed codes (what a worker keeps in
+memory); the float32 side file is only paged in for candidates. A factor of
+1 means no re-ranking beyond the k hits themselves.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import faiss
+
+from benchmarks.bench_ann import recall_at_k, report, synthetic_corpus, time_queries
+from services import ann_index
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=100000, help="corpus vectors")
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--index-type", default="flat", choices=ann_index.INDEX_TYPES)
+    parser.add_argument("--compressions", default="fp16,int8")
+    parser.add_argument("--factors", default="1,2,4,8", help="RERANK_FACTOR values to sweep")
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads (1 = per-request cost)")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    corpus, queries = synthetic_corpus(args.n, args.dim, args.queries)
+    float32_mb = corpus.nbytes / 2**20
+    print(f"{args.n} x {args.dim} corpus, {args.queries} queries, k={args.k}, {args.threads} thread(s)")
+
+    start = time.perf_counter()
+    flat = faiss.IndexFlatL2(args.dim)
+    flat.add(corpus)
+    truth, latencies = time_queries(flat.search, queries, args.k)
+    report("float32 (exact)", time.perf_counter() - start, float32_mb, latencies, 1.0)
+
+    # Always build, whatever ANN_MIN_VECTORS says
+    ann_index.ANN_MIN_VECTORS = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        for compression in [c.strip() for c in args.compressions.split(",") if c.strip()]:
+            start = time.perf_counter()
+            ann = ann_index.build(corpus, args.index_type, compression=compression)
+            build_s = time.perf_counter() - start
+            path = os.path.join(tmp, f"{compression}.faiss")
+            ann = ann_index.read(path, ann_index.write(ann, path))
+            resident_mb = len(faiss.serialize_index(ann.index)) / 2**20
+            print(
+                f"{args.index_type}+{compression}: resident {resident_mb:.1f} MB "
+                f"({100 * (1 - resident_mb / float32_mb):.0f}% saved vs float32)"
+            )
+            for factor in [int(f) for f in args.factors.split(",") if f.strip()]:
+                ann_index.RERANK_FACTOR = factor
+                found, latencies = time_queries(lambda q, k: ann_index.search(ann, q, k), queries, args.k)
+                report(
+                    f"{args.index_type}+{compression} rerank x{factor}",
+                    build_s,
+                    resident_mb,
+                    latencies,
+                    recall_at_k(found, truth),
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Throughput benchmark: per-page text embedding (the old ingestion behaviour)
+versus cross-page, length-bucketed batching used by build_unified_index.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_text_batching [path/to/file.pdf] [--repeat N] [--batch-size B]
+
+Without a PDF a synthetic corpus of mixed short and long pages is used.
+Reports chunks/sec and the number of padded token positions fed to CLIP.
+"""
+
+import argparse
+import random
+import time
+from typing import List
+
+import fitz  # PyMuPDF
+from langchain_core.documents import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from services.langchain_pipeline import (
+    CLIP_MAX_TOKENS,
+    TEXT_BATCH_SIZE,
+    _LengthBucketedBatcher,
+    embed_text_clip,
+    get_clip,
+)
+
+
+WORDS = "model vector index page image query search document retrieval embedding batch latency".split()
+
+
+def _synthetic_pages(n_pages: int, seed: int = 0) -> List[str]:
+    rng = random.Random(seed)
+    pages = []
+    for _ in range(n_pages):
+        # Mostly short pages (titles, captions, slide text) plus some dense ones
+        n_words = rng.choice([5, 10, 20, 40]) if rng.random() < 0.7 else rng.randint(150, 400)
+        pages.append(" ".join(rng.choice(WORDS) for _ in range(n_words)))
+    return pages
+
+
+def _pdf_pages(pdf_path: str) -> List[str]:
+    doc = fitz.open(pdf_path)
+    pages = [page.get_text() or "" for page in doc]
+    doc.close()
+    return [p for p in pages if p.strip()]
+
+
+def _split(pages: List[str]) -> List[List[str]]:
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
+    return [[c.page_content for c in splitter.split_documents([Document(page_content=p)])] for p in pages]
+
+
+def _padded_tokens(batches: List[List[str]]) -> int:
+    _, processor = get_clip()
+    total = 0
+    for batch in batches:
+        lengths = [min(CLIP_MAX_TOKENS, len(ids)) for ids in processor.tokenizer(batch)["input_ids"]]
+        total += len(batch) * max(lengths)
+    return total
+
+
+def run_per_page(page_chunks: List[List[str]]) -> List[List[str]]:
+    batches = []
+    for chunks in page_chunks:
+        if chunks:
+            embed_text_clip(chunks)
+            batches.append(chunks)
+    return batches
+
+
+def run_bucketed(page_chunks: List[List[str]], batch_size: int) -> List[List[str]]:
+    batches: List[List[str]] = []
+
+    def recording_embed(texts: List[str]):
+        batches.append(list(texts))
+        return embed_text_clip(texts)
+
+    batcher = _LengthBucketedBatcher(recording_embed, [], [], batch_size)
+    for chunks in page_chunks:
+        for chunk in chunks:
+            batcher.add(Document(page_content=chunk), chunk)
+    batcher.flush()
+    return batches
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf", nargs="?", help="PDF to take page text from (default: synthetic corpus)")
+    parser.add_argument("--pages", type=int, default=300, help="synthetic page count")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=TEXT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    pages = _pdf_pages(args.pdf) if args.pdf else _synthetic_pages(args.pages)
+    page_chunks = _split(pages)
+    n_chunks = sum(len(c) for c in page_chunks)
+    print(f"{len(pages)} pages, {n_chunks} chunks, batch size {args.batch_size}")
+
+    get_clip()
+    embed_text_clip(["warmup"])
+
+    for name, fn in (
+        ("per-page", lambda: run_per_page(page_chunks)),
+        ("bucketed", lambda: run_bucketed(page_chunks, args.batch_size)),
+    ):
+        timings = []
+        batches: List[List[str]] = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            batches = fn()
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        print(
+            f"{name:>9}: {n_chunks / best:8.1f} chunks/s  best {best:.3f}s  "
+            f"{len(batches)} forward passes  {_padded_tokens(batches)} padded token positions"
+        )
+
+
+if __name__ == "__main__":
+    main()
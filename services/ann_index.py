@@ -0,0 +1,226 @@
+import math
+import os
+from typing import Any, Dict, NamedTuple, Tuple
+
+import faiss
+import numpy as np
+
+from services import mmap_store
+
+
+# Search structure used on top of the exact flat store: flat | hnsw | ivf_flat | ivf_pq.
+# The flat LangChain store stays the source of truth (ids, deletes, vectors);
+# the ANN index is derived from it with the same positional order.
+INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat").lower()
+# Below this many vectors exact search is fast enough and IVF training is unreliable
+ANN_MIN_VECTORS = int(os.getenv("ANN_MIN_VECTORS", "20000"))
+
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # 0: about 4 * sqrt(n)
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+# Retrain the coarse quantizer once the corpus outgrows its training set by this factor
+IVF_RETRAIN_GROWTH = 4.0
+PQ_M = int(os.getenv("PQ_M", "64"))  # sub-quantizers; must divide the dimension
+PQ_NBITS = int(os.getenv("PQ_NBITS", "8"))
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "80"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+
+# Compressed codes for the candidate search: none | fp16 | int8 (scalar quantizer).
+# Candidates are then re-ranked by exact float32 distance against the flat
+# store, whose memory-mapped vectors are only touched at the candidate rows.
+# With ivf_pq, whose codes are already compressed, any value other than none
+# just enables the re-ranking.
+VECTOR_COMPRESSION = os.getenv("VECTOR_COMPRESSION", "none").lower()
+RERANK_FACTOR = int(os.getenv("RERANK_FACTOR", "4"))  # candidates fetched per requested hit
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq")
+COMPRESSIONS = ("none", "fp16", "int8")
+_SQ_TYPES = {"fp16": faiss.ScalarQuantizer.QT_fp16, "int8": faiss.ScalarQuantizer.QT_8bit}
+
+
+class AnnIndex(NamedTuple):
+    index: faiss.Index
+    index_type: str
+    trained_on: int  # vectors the IVF quantizer was trained on (0 for HNSW)
+    compression: str = "none"  # anything but none: search() re-ranks against the flat store
+
+
+def enabled(index_type: str = INDEX_TYPE, compression: str = VECTOR_COMPRESSION) -> bool:
+    """False when plain exact search on the flat store is configured."""
+    return index_type != "flat" or compression != "none"
+
+
+def matches(ann: AnnIndex | Dict[str, Any] | None) -> bool:
+    """Whether ann (or its write() metadata) was built with the configured type and compression."""
+    if isinstance(ann, AnnIndex):
+        ann = {"index_type": ann.index_type, "compression": ann.compression}
+    return (
+        ann is not None
+        and ann.get("index_type") == INDEX_TYPE
+        and ann.get("compression", "none") == VECTOR_COMPRESSION
+    )
+
+
+def _nlist_for(n: int) -> int:
+    nlist = IVF_NLIST or int(4 * math.sqrt(n))
+    # k-means wants ~39 points per centroid; never ask for more lists than that allows
+    return max(1, min(nlist, n // 39 or 1))
+
+
+def create_index(index_type: str, dim: int, n: int, compression: str = VECTOR_COMPRESSION) -> faiss.Index:
+    """Empty (untrained) index of index_type sized for about n vectors. L2, like the flat store."""
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown vector compression: {compression}")
+    sq_type = _SQ_TYPES.get(compression)
+    if index_type == "flat":
+        if sq_type is None:
+            raise ValueError("An uncompressed flat index is the store itself")
+        return faiss.IndexScalarQuantizer(dim, sq_type, faiss.METRIC_L2)
+    if index_type == "hnsw":
+        if sq_type is None:
+            index = faiss.IndexHNSWFlat(dim, HNSW_M)
+        else:
+            index = faiss.IndexHNSWSQ(dim, sq_type, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+        return index
+    nlist = _nlist_for(n)
+    quantizer = faiss.IndexFlatL2(dim)
+    if index_type == "ivf_flat" and sq_type is not None:
+        index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, sq_type, faiss.METRIC_L2)
+    elif index_type == "ivf_flat":
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+    elif index_type == "ivf_pq":
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, PQ_M, PQ_NBITS)
+    else:
+        raise ValueError(f"Unknown index type: {index_type}")
+    index.nprobe = IVF_NPROBE
+    return index
+
+
+def build(
+    vectors: np.ndarray,
+    index_type: str = INDEX_TYPE,
+    reuse: AnnIndex | None = None,
+    compression: str = VECTOR_COMPRESSION,
+) -> AnnIndex | None:
+    """
+    ANN index over vectors (row i gets label i), or None when exact search
+    should be used. A previous IVF index of the same type is emptied and
+    refilled instead of retrained while the corpus has not outgrown it.
+    """
+    n, dim = vectors.shape if vectors.ndim == 2 else (0, 0)
+    if not enabled(index_type, compression) or n < ANN_MIN_VECTORS:
+        return None
+    if index_type == "ivf_pq" and n < 2**PQ_NBITS:
+        return None  # too few points to train the PQ codebooks; stay exact
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    if (
+        reuse is not None
+        and reuse.index_type == index_type
+        and reuse.compression == compression
+        and index_type.startswith("ivf")
+        and not needs_retrain(reuse, n)
+    ):
+        index = mmap_store.owned_copy(reuse.index)
+        index.reset()
+        trained_on = reuse.trained_on
+    else:
+        index = create_index(index_type, dim, n, compression)
+        trained_on = 0
+        if not index.is_trained:
+            index.train(vectors)
+            trained_on = n
+    index.add(vectors)
+    return AnnIndex(index, index_type, trained_on, compression)
+
+
+def extend(ann: AnnIndex, vectors: np.ndarray) -> AnnIndex:
+    """Copy of ann with vectors appended (labels continue from ntotal)."""
+    index = mmap_store.owned_copy(ann.index)
+    if len(vectors):
+        index.add(np.ascontiguousarray(vectors, dtype="float32"))
+    return AnnIndex(index, ann.index_type, ann.trained_on, ann.compression)
+
+
+def needs_retrain(ann: AnnIndex, n: int) -> bool:
+    return ann.index_type.startswith("ivf") and n > ann.trained_on * IVF_RETRAIN_GROWTH
+
+
+def search_params(
+    ann: AnnIndex, nprobe: int | None = None, ef_search: int | None = None, sel: faiss.IDSelector | None = None
+) -> Any:
+    """Per-query SearchParameters (breadth, and an optional IDSelector filter); None keeps the index defaults."""
+    # Parameter objects replace every index default, so unset breadths fall back to the index's own
+    if ann.index_type.startswith("ivf") and (nprobe or sel is not None):
+        return faiss.SearchParametersIVF(nprobe=max(1, int(nprobe or ann.index.nprobe)), sel=sel)
+    if ann.index_type == "hnsw" and (ef_search or sel is not None):
+        return faiss.SearchParametersHNSW(efSearch=max(1, int(ef_search or ann.index.hnsw.efSearch)), sel=sel)
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+    return None
+
+
+def rerank(
+    exact: faiss.Index, queries: np.ndarray, candidates: np.ndarray, k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Exact L2 top-k among each query's candidate labels, read from the flat index exact (-1 padded, like faiss)."""
+    distances = np.full((len(queries), k), np.inf, dtype="float32")
+    labels = np.full((len(queries), k), -1, dtype="int64")
+    for i, (query, row) in enumerate(zip(queries, candidates)):
+        # sorted reads walk the memory-mapped codes forwards
+        row = np.unique(row[row >= 0])
+        if not len(row):
+            continue
+        l2 = ((exact.reconstruct_batch(row) - query) ** 2).sum(axis=1)
+        order = np.argsort(l2, kind="stable")[:k]
+        distances[i, : len(order)] = l2[order]
+        labels[i, : len(order)] = row[order]
+    return distances, labels
+
+
+def search(
+    ann: AnnIndex,
+    queries: np.ndarray,
+    k: int,
+    nprobe: int | None = None,
+    ef_search: int | None = None,
+    sel: faiss.IDSelector | None = None,
+    exact: faiss.Index | None = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Top-k labels for queries. With compression, RERANK_FACTOR * k candidates
+    are re-ranked against exact, the flat store the index was derived from;
+    without exact the compressed distances are returned as they are.
+    """
+    queries = np.ascontiguousarray(np.atleast_2d(queries), dtype="float32")
+    params = search_params(ann, nprobe, ef_search, sel)
+    if ann.compression == "none" or exact is None:
+        return ann.index.search(queries, k, params=params)
+    _, candidates = ann.index.search(queries, k * max(1, RERANK_FACTOR), params=params)
+    return rerank(exact, queries, candidates, k)
+
+
+def write(ann: AnnIndex, path: str) -> Dict[str, Any]:
+    """Saves the index to path; returns the metadata read() needs alongside it."""
+    faiss.write_index(ann.index, path)
+    return {"index_type": ann.index_type, "trained_on": ann.trained_on, "compression": ann.compression}
+
+
+def read(path: str, meta: Dict[str, Any]) -> AnnIndex:
+    """Memory-mapped where FAISS supports it (flat/IVF storage), so workers share pages."""
+    compression = meta.get("compression", "none")
+    return AnnIndex(mmap_store.read_index(path), meta["index_type"], int(meta.get("trained_on", 0)), compression)
+
+
+def describe(ann: AnnIndex | None) -> Dict[str, Any]:
+    if ann is None:
+        return {"index_type": "flat"}
+    info: Dict[str, Any] = {"index_type": ann.index_type, "vectors": int(ann.index.ntotal)}
+    if ann.compression != "none":
+        info.update(compression=ann.compression, rerank_factor=RERANK_FACTOR)
+    if ann.index_type.startswith("ivf"):
+        info.update(nlist=int(ann.index.nlist), nprobe=int(ann.index.nprobe), trained_on=ann.trained_on)
+    elif ann.index_type == "hnsw":
+        info.update(M=HNSW_M, ef_search=int(ann.index.hnsw.efSearch))
+    return info
@@ -0,0 +1,241 @@
+import bisect
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+from services import mmap_store
+from services.search_filters import Selection
+
+
+# Okapi BM25 over chunk text, for keyword queries CLIP's 77-token text encoder
+# handles poorly. Chunks are identified by their position in the flat store,
+# like the ANN index, so results can be fused with the FAISS ranking directly.
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+# On-disk layout (all arrays memory-mapped on load, like mmap_store):
+#   manifest.json                {"format", "count", "total_length"}
+#   terms.offsets.npy / .bin     sorted vocabulary (mmap_store string column)
+#   offsets.npy                  int64, postings of term t are [offsets[t], offsets[t + 1])
+#   positions.npy / tfs.npy      int32 chunk positions (ascending per term) / uint16 term frequencies
+#   weights.npy                  float32 BM25 term weight of each posting, before idf
+#   lengths.npy                  int32 tokens per chunk
+FORMAT_VERSION = 1
+_ARRAYS = ("offsets", "positions", "tfs", "weights", "lengths")
+
+_TOKEN_RE = re.compile(r"\w+")
+_MAX_TF = np.iinfo(np.uint16).max
+_PROBE_RATIO = 16
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+class Bm25Index(NamedTuple):
+    terms: Sequence[str]  # sorted vocabulary: a list, or a StringColumn once loaded
+    offsets: np.ndarray
+    positions: np.ndarray
+    tfs: np.ndarray
+    weights: np.ndarray  # tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / avg_length)) per posting
+    lengths: np.ndarray
+    total_length: int
+
+    @property
+    def count(self) -> int:
+        return len(self.lengths)
+
+
+def empty() -> Bm25Index:
+    return Bm25Index(
+        [],
+        np.zeros(1, dtype=np.int64),
+        np.zeros(0, dtype=np.int32),
+        np.zeros(0, dtype=np.uint16),
+        np.zeros(0, dtype=np.float32),
+        np.zeros(0, dtype=np.int32),
+        0,
+    )
+
+
+def _weights(positions: np.ndarray, tfs: np.ndarray, lengths: np.ndarray, total_length: int) -> np.ndarray:
+    """
+    Per-posting BM25 weights. They depend on the average chunk length, so
+    they are recomputed (vectorized) whenever chunks are added or removed,
+    leaving only a scaled scatter-add per posting at query time.
+    """
+    if not len(positions):
+        return np.zeros(0, dtype=np.float32)
+    avg_length = max(total_length, 1) / len(lengths)
+    tf = tfs.astype(np.float32)
+    norm = BM25_K1 * (1.0 - BM25_B + BM25_B * lengths[positions].astype(np.float32) / avg_length)
+    return tf * (BM25_K1 + 1.0) / (tf + norm)
+
+
+def build(texts: List[str]) -> Bm25Index:
+    return add(empty(), texts)
+
+
+def add(index: Bm25Index, texts: List[str]) -> Bm25Index:
+    """
+    Copy of index with texts appended as chunks count, count + 1, ...
+    Only the new texts are tokenized and only their postings are sorted;
+    existing postings are copied over with array operations.
+    """
+    if not texts:
+        return index
+    start = index.count
+    counts = [Counter(tokenize(text)) for text in texts]
+    old_terms = [index.terms[i] for i in range(len(index.terms))]
+    vocabulary = sorted(set(old_terms).union(*counts))
+    term_ids = {term: i for i, term in enumerate(vocabulary)}
+
+    new_term: List[int] = []
+    new_position: List[int] = []
+    new_tf: List[int] = []
+    for offset, chunk_counts in enumerate(counts):
+        for term, tf in chunk_counts.items():
+            new_term.append(term_ids[term])
+            new_position.append(start + offset)
+            new_tf.append(min(tf, _MAX_TF))
+
+    old_df = np.zeros(len(vocabulary), dtype=np.int64)
+    old_df[np.asarray([term_ids[t] for t in old_terms], dtype=np.int64)] = np.diff(index.offsets)
+    new_term = np.asarray(new_term, dtype=np.int64)
+    # Old postings keep their order and each new posting goes right after its
+    # term's old ones (new chunks have the highest positions), so inserting
+    # the term-sorted new postings keeps positions ascending within every term.
+    order = np.argsort(new_term, kind="stable")
+    where = np.cumsum(old_df)[new_term[order]]
+    positions = np.insert(np.asarray(index.positions), where, np.asarray(new_position, dtype=np.int32)[order])
+    tfs = np.insert(np.asarray(index.tfs), where, np.asarray(new_tf, dtype=np.uint16)[order])
+    offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+    np.cumsum(old_df + np.bincount(new_term, minlength=len(vocabulary)), out=offsets[1:])
+
+    lengths = np.concatenate([index.lengths, np.asarray([sum(c.values()) for c in counts], dtype=np.int32)])
+    total_length = int(lengths.sum())
+    return Bm25Index(
+        vocabulary, offsets, positions, tfs, _weights(positions, tfs, lengths, total_length), lengths, total_length
+    )
+
+
+def remove(index: Bm25Index, removed: Sequence[int]) -> Bm25Index:
+    """Copy of index without the chunks at removed, with later positions renumbered to close the gaps."""
+    removed = np.unique(np.asarray(removed, dtype=np.int64))
+    if not len(removed):
+        return index
+    keep = ~np.isin(index.positions, removed)
+    term = np.repeat(np.arange(len(index.terms)), np.diff(index.offsets))[keep]
+    positions = np.asarray(index.positions[keep], dtype=np.int32)
+    positions -= np.searchsorted(removed, positions).astype(np.int32)
+
+    df = np.bincount(term, minlength=len(index.terms))
+    live = df > 0
+    offsets = np.zeros(int(live.sum()) + 1, dtype=np.int64)
+    np.cumsum(df[live], out=offsets[1:])
+    tfs = np.asarray(index.tfs[keep])
+    lengths = np.delete(np.asarray(index.lengths), removed)
+    total_length = int(lengths.sum())
+    return Bm25Index(
+        [index.terms[i] for i in np.flatnonzero(live)],
+        offsets,
+        positions,
+        tfs,
+        _weights(positions, tfs, lengths, total_length),
+        lengths,
+        total_length,
+    )
+
+
+def _term_id(terms: Sequence[str], term: str) -> int | None:
+    i = bisect.bisect_left(terms, term)
+    return i if i < len(terms) and terms[i] == term else None
+
+
+def search(
+    index: Bm25Index, query: str, k: int, selected: Selection | None = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (scores, positions) of the top-k chunks for query, best first; only chunks
+    sharing a term, and with a filter selection, only chunks it admits.
+    Terms are scored rarest first (MaxScore): once the k-th best score beats
+    what the remaining terms could add, chunks not yet matched cannot enter
+    the top k, and the long posting lists of common terms are only probed
+    for the chunks already matched instead of scanned.
+    """
+    n = index.count
+    terms = []
+    for term in dict.fromkeys(tokenize(query)):
+        t = _term_id(index.terms, term)
+        if t is not None:
+            lo, hi = int(index.offsets[t]), int(index.offsets[t + 1])
+            terms.append((math.log(1.0 + (n - (hi - lo) + 0.5) / ((hi - lo) + 0.5)), lo, hi))
+    if not terms or k <= 0:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+    terms.sort(reverse=True)
+    # remaining[i]: the most terms i.. can add to any chunk's score
+    remaining = np.cumsum([idf * (BM25_K1 + 1.0) for idf, _, _ in reversed(terms)])[::-1]
+
+    scores = np.zeros(n, dtype=np.float32)
+    candidates = None
+    seen = 0  # postings scored so far: an upper bound on the chunks matched
+    for i, (idf, lo, hi) in enumerate(terms):
+        positions = index.positions[lo:hi]
+        weights = index.weights[lo:hi]
+        # Probing costs a binary search per candidate, so it only pays off
+        # against a posting list much longer than the candidate set
+        if candidates is None and i > 0 and seen * _PROBE_RATIO < hi - lo:
+            matched = np.flatnonzero(scores)
+            if selected is not None:
+                matched = matched[selected.admits(matched)]
+            if len(matched) >= k and np.partition(scores[matched], len(matched) - k)[len(matched) - k] >= remaining[i]:
+                candidates = matched
+        if candidates is not None and len(candidates) * _PROBE_RATIO < hi - lo:
+            found = np.minimum(np.searchsorted(positions, candidates), len(positions) - 1)
+            hit = positions[found] == candidates
+            scores[candidates[hit]] += idf * weights[found[hit]]
+        elif hi - lo > n // 4:
+            # near-stopword: one sequential pass beats a scattered += over most chunks
+            scores += np.bincount(positions, weights=idf * weights, minlength=n).astype(np.float32)
+        else:
+            # a term lists each chunk once, so the fancy-indexed += does not collide
+            scores[positions] += idf * weights
+        seen += hi - lo
+
+    if candidates is not None:
+        matched = candidates
+    else:
+        matched = np.flatnonzero(scores)
+        if selected is not None:
+            matched = matched[selected.admits(matched)]
+    if len(matched) > k:
+        matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+    best = matched[np.argsort(-scores[matched], kind="stable")]
+    return scores[best], best
+
+
+def write(index: Bm25Index, directory: str) -> None:
+    """Writes index to directory, which must not exist yet."""
+    os.makedirs(directory)
+    mmap_store.write_string_column(directory, "terms", [index.terms[i] for i in range(len(index.terms))])
+    mmap_store.save_arrays(directory, {name: getattr(index, name) for name in _ARRAYS})
+    mmap_store.write_manifest(directory, FORMAT_VERSION, count=index.count, total_length=index.total_length)
+
+
+def load(directory: str) -> Bm25Index:
+    manifest = mmap_store.read_manifest(directory, FORMAT_VERSION)
+    return Bm25Index(
+        terms=mmap_store.StringColumn(directory, "terms"),
+        total_length=int(manifest["total_length"]),
+        **mmap_store.load_arrays(directory, _ARRAYS),
+    )
+
+
+def describe(index: Bm25Index | None) -> Dict[str, Any]:
+    if index is None:
+        return {"enabled": False}
+    return {"enabled": True, "chunks": index.count, "terms": len(index.terms), "postings": len(index.positions)}
@@ -0,0 +1,115 @@
+import os
+import platform
+import shutil
+import subprocess
+import threading
+from typing import Any, Dict, List
+
+from services import metrics
+from services.log import get_logger
+
+
+log = get_logger(__name__)
+
+# Seconds a clipboard tool may run before it is killed (xclip can hang without a display)
+CLIPBOARD_TIMEOUT = 5.0
+
+
+def detect_commands() -> List[List[str]]:
+    """Installed clipboard tools for this platform, in the order they should be tried."""
+    system = platform.system()
+    if system == "Windows":
+        candidates = [["clip"]]
+    elif system == "Darwin":
+        candidates = [["pbcopy"]]
+    elif system == "Linux":
+        candidates = [["xclip", "-selection", "clipboard"], ["xsel", "--clipboard", "--input"]]
+        if os.environ.get("WAYLAND_DISPLAY"):
+            # wl-copy may be installed under X11 too, where it fails
+            candidates.insert(0, ["wl-copy"])
+    else:
+        return []
+    return [command for command in candidates if shutil.which(command[0])]
+
+
+class ClipboardWorker:
+    """
+    Copies text to the system clipboard on one background thread. Only the
+    latest text matters: copy() overwrites a text still waiting, so a burst of
+    responses costs one subprocess. Tools are detected once at start-up and
+    tried in order until one succeeds, which is then used from then on; with
+    none available, or once all are gone, copy() is a no-op.
+    """
+
+    def __init__(self, commands: List[List[str]] | None = None) -> None:
+        self._commands = list(commands) if commands is not None else detect_commands()
+        self._confirmed = False  # _commands[0] has copied successfully
+        self._cond = threading.Condition()
+        self._pending: str | None = None
+        self._counters = {"copied": 0, "failed": 0, "superseded": 0}
+        if not self._commands:
+            log.warning("No clipboard tool found; clipboard copy disabled")
+            return
+        threading.Thread(target=self._run, name="clipboard", daemon=True).start()
+
+    @property
+    def command(self) -> List[str] | None:
+        """The tool in use (or tried first, until one has succeeded)."""
+        commands = self._commands
+        return commands[0] if commands else None
+
+    @property
+    def available(self) -> bool:
+        return bool(self._commands)
+
+    def copy(self, text: str) -> bool:
+        """Queues text for the clipboard; returns False if copying is unavailable."""
+        if not text or not self._commands:
+            return False
+        with self._cond:
+            if self._pending is not None:
+                self._counters["superseded"] += 1
+            self._pending = text
+            self._cond.notify()
+        return True
+
+    def _run(self) -> None:
+        while self._commands:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+                text, self._pending = self._pending, None
+            if self._copy(text):
+                self._counters["copied"] += 1
+                log.debug("Copied %d characters to clipboard", len(text))
+            else:
+                self._counters["failed"] += 1
+        log.error("No working clipboard tool left; clipboard copy disabled")
+
+    def _copy(self, text: str) -> bool:
+        """Runs the tools in order until one succeeds; the first to succeed is kept as the only one."""
+        for command in list(self._commands):
+            try:
+                with metrics.STAGE_SECONDS.time(stage="clipboard"):
+                    subprocess.run(command, input=text, text=True, check=True, timeout=CLIPBOARD_TIMEOUT)
+            except FileNotFoundError:
+                log.error("Clipboard tool %s disappeared", command[0])
+                self._commands = [c for c in self._commands if c is not command]
+                continue
+            except (subprocess.SubprocessError, OSError) as e:
+                log.error("Failed to copy to clipboard with %s: %s", command[0], e)
+                if self._confirmed:
+                    return False
+                continue
+            if not self._confirmed:
+                self._commands, self._confirmed = [command], True
+            return True
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "tool": self.command[0] if self.command else None,
+                "pending": self._pending is not None,
+                **self._counters,
+            }
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable
+
+import numpy as np
+
+
+BASE_DIR = os.getcwd()
+DEFAULT_CACHE_PATH = os.path.join(BASE_DIR, "data", "index", "embedding_cache.sqlite")
+
+# Fraction of entries dropped when the cache overflows, so eviction runs
+# once per many inserts instead of on every one.
+_EVICT_FRACTION = 0.1
+
+
+def text_key(model_name: str, text: str) -> str:
+    """Cache key for a text chunk; whitespace differences do not change the key."""
+    normalized = " ".join(text.split())
+    return hashlib.sha256(f"{model_name}\0text\0{normalized}".encode("utf-8")).hexdigest()
+
+
+def image_key(model_name: str, image_bytes: bytes) -> str:
+    """Cache key for an image, from the raw bytes extracted from the PDF."""
+    h = hashlib.sha256(f"{model_name}\0image\0".encode("utf-8"))
+    h.update(image_bytes)
+    return h.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent content-addressed embedding cache in a single SQLite file.
+    Vectors are stored as raw float32 bytes. Least recently used entries are
+    evicted once the cache exceeds max_bytes worth of vectors. WAL mode lets
+    several processes share the file.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = 512 * 1024 * 1024, dim: int = 512) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.dim = dim
+        self.max_entries = max(1, max_bytes // (dim * 4))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            # SQLite limits bound parameters per statement
+            for i in range(0, len(keys), 500):
+                part = keys[i : i + 500]
+                marks = ",".join("?" * len(part))
+                rows = self._conn.execute(f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype="float32")
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE key IN ({marks})", [time.time(), *part]
+                    )
+            self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, np.asarray(vec, dtype="float32").tobytes(), now) for key, vec in items.items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+            self._count += len(rows)
+            if self._count > self.max_entries:
+                self._evict()
+
+    def _evict(self) -> None:
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = self._count - self.max_entries
+        if excess <= 0:
+            return
+        n_drop = excess + int(self.max_entries * _EVICT_FRACTION)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (n_drop,)
+        )
+        self._conn.commit()
+        self._count = max(0, self._count - n_drop)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": self._count, "max_entries": self.max_entries, "hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_cache: EmbeddingCache | None = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache | None:
+    """Process-wide cache, configured from EMBEDDING_CACHE* env vars. None when disabled."""
+    global _cache
+    if os.getenv("EMBEDDING_CACHE", "1").lower() in ("0", "false", "off"):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(
+                    path=os.getenv("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH),
+                    max_bytes=int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512")) * 1024 * 1024,
+                )
+    return _cache
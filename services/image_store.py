@@ -0,0 +1,88 @@
+import base64
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, Iterable, Set
+
+
+BASE_DIR = os.getcwd()
+IMAGES_DIR = os.path.join(BASE_DIR, "data", "index", "langchain", "images")
+# Files written (or re-used) this recently are never garbage collected: an
+# ingestion may have stored them but not published its generation yet.
+GC_GRACE_SECONDS = 3600
+
+
+def image_path(sha: str) -> str:
+    return os.path.join(IMAGES_DIR, f"{sha}.png")
+
+
+def put_png(png_bytes: bytes) -> str:
+    """
+    Stores PNG bytes under their sha256 and returns the hash. Identical images
+    (e.g. a logo on every page, or the same document uploaded twice) share one file.
+    """
+    sha = hashlib.sha256(png_bytes).hexdigest()
+    path = image_path(sha)
+    try:
+        os.utime(path)
+        return sha
+    except OSError:
+        pass
+    os.makedirs(IMAGES_DIR, exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, "wb") as f:
+        f.write(png_bytes)
+    os.replace(tmp_path, path)
+    return sha
+
+
+def read_png(sha: str) -> bytes | None:
+    try:
+        with open(image_path(sha), "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def read_base64(refs: Dict[str, str], image_ids: Iterable[str]) -> Dict[str, str]:
+    """Loads base64 PNGs for just the requested image ids (image_id -> sha in refs)."""
+    images: Dict[str, str] = {}
+    for image_id in image_ids:
+        sha = refs.get(image_id)
+        if sha is None or image_id in images:
+            continue
+        data = read_png(sha)
+        if data is not None:
+            images[image_id] = base64.b64encode(data).decode()
+    return images
+
+
+def import_base64_map(image_data: Dict[str, str]) -> Dict[str, str]:
+    """Moves a legacy image_id -> base64 PNG map into the store; returns image_id -> sha."""
+    refs: Dict[str, str] = {}
+    for image_id, b64 in image_data.items():
+        try:
+            refs[image_id] = put_png(base64.b64decode(b64))
+        except Exception:
+            continue
+    return refs
+
+
+def remove_unreferenced(referenced: Set[str]) -> int:
+    if not os.path.isdir(IMAGES_DIR):
+        return 0
+    removed = 0
+    cutoff = time.time() - GC_GRACE_SECONDS
+    for name in os.listdir(IMAGES_DIR):
+        sha, ext = os.path.splitext(name)
+        if ext == ".png" and sha not in referenced:
+            path = os.path.join(IMAGES_DIR, name)
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    continue
+                os.remove(path)
+                removed += 1
+            except OSError:
+                continue
+    return removed
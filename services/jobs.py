@@ -0,0 +1,146 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's progress callback once cancellation was requested."""
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    """
+    State of one background ingestion. Workers report through progress();
+    everything else only reads, via to_dict().
+    """
+
+    def __init__(self, name: str) -> None:
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.status = "queued"  # queued | running | done | failed | cancelled
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.pages_total = 0
+        self.pages_parsed = 0
+        self.vectors_embedded = 0
+        self.result: Dict[str, Any] | None = None
+        self.error: str | None = None
+        self._cancel = threading.Event()
+
+    def progress(self, pages_parsed: int, pages_total: int, vectors_embedded: int) -> None:
+        self.pages_parsed = pages_parsed
+        self.pages_total = pages_total
+        self.vectors_embedded = vectors_embedded
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+
+    def eta_seconds(self) -> float | None:
+        if self.status != "running" or not self.started_at or not self.pages_parsed or not self.pages_total:
+            return None
+        elapsed = time.time() - self.started_at
+        return elapsed / self.pages_parsed * (self.pages_total - self.pages_parsed)
+
+    def to_dict(self) -> Dict[str, Any]:
+        eta = self.eta_seconds()
+        return {
+            "job_id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "pages_total": self.pages_total,
+            "pages_parsed": self.pages_parsed,
+            "vectors_embedded": self.vectors_embedded,
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """
+    Runs jobs on max_workers background threads. At most max_pending jobs may
+    wait for a worker (submit raises QueueFull beyond that), and only the most
+    recent keep_finished finished jobs are remembered.
+    """
+
+    def __init__(self, max_workers: int = 1, max_pending: int = 16, keep_finished: int = 100) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._max_pending = max_pending
+        self._keep_finished = keep_finished
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        name: str,
+        fn: Callable[[Job], Dict[str, Any]],
+        cleanup: Callable[[], None] | None = None,
+    ) -> Job:
+        """
+        fn(job) does the work, reporting through job.progress(), and returns the
+        result. cleanup() runs once the job is over: done, failed, or cancelled
+        (also when cancelled before it started).
+        """
+        job = Job(name)
+        with self._lock:
+            queued = sum(1 for j in self._jobs.values() if j.status == "queued")
+            if queued >= self._max_pending:
+                raise QueueFull(f"{queued} jobs already waiting")
+            self._jobs[job.id] = job
+            self._trim()
+        self._executor.submit(self._run, job, fn, cleanup)
+        return job
+
+    def _run(self, job: Job, fn: Callable[[Job], Dict[str, Any]], cleanup: Callable[[], None] | None) -> None:
+        try:
+            with self._lock:
+                if job._cancel.is_set():
+                    return
+                job.status = "running"
+                job.started_at = time.time()
+            try:
+                job.result = fn(job)
+                job.status = "done"
+            except JobCancelled:
+                job.status = "cancelled"
+            except Exception as e:
+                job.error = str(e)
+                job.status = "failed"
+            finally:
+                job.finished_at = time.time()
+        finally:
+            if cleanup is not None:
+                cleanup()
+
+    def _trim(self) -> None:
+        finished = [j.id for j in self._jobs.values() if j.finished_at is not None]
+        for job_id in finished[: max(0, len(finished) - self._keep_finished)]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> Job | None:
+        """Requests cancellation; a running job stops at its next progress report."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.finished_at is None:
+                job._cancel.set()
+                if job.status == "queued":
+                    job.status = "cancelled"
+                    job.finished_at = time.time()
+        return job
@@ -1,42 +1,105 @@
 import os
-import io
 import json
-import base64
-from typing import Any, Dict, List, Tuple
+import hashlib
+import re
+import shutil
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, NamedTuple, Sequence, Tuple
 
+try:
+    import fcntl
+except ImportError:  # Windows: publishes are only serialized within the process
+    fcntl = None
+
+import faiss
 import fitz  # PyMuPDF
 import numpy as np
-import torch
 from PIL import Image
-from transformers import CLIPModel, CLIPProcessor
 from langchain_core.documents import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
 
+from services import ann_index, bm25_index, image_store, metrics, mmap_store, pdf_parsing, search_filters
+from services.embedding_cache import EmbeddingCache, get_embedding_cache, text_key
+from services.query_cache import LRUCache
+
+if TYPE_CHECKING:
+    from transformers import CLIPModel, CLIPProcessor
+
 
 BASE_DIR = os.getcwd()
 STORE_DIR = os.path.join(BASE_DIR, "data", "index", "langchain")
 FAISS_DIR = os.path.join(STORE_DIR, "faiss_lc")
 IMAGE_DATA_JSON = os.path.join(STORE_DIR, "image_data.json")
+# Each build is written to its own immutable directory under GENERATIONS_DIR and
+# published by atomically replacing CURRENT_FILE, which holds the generation id.
+# FAISS_DIR / IMAGE_DATA_JSON are only read as a fallback for pre-existing stores.
+# Image bytes live in the content-addressed image_store; a generation only
+# records image_id -> sha256 in images.json.
+GENERATIONS_DIR = os.path.join(STORE_DIR, "generations")
+CURRENT_FILE = os.path.join(STORE_DIR, "CURRENT")
+KEEP_GENERATIONS = 2
+# flock()ed around every read-merge-publish, so concurrent ingestion in
+# several worker processes cannot publish over each other's documents.
+PUBLISH_LOCK_FILE = os.path.join(STORE_DIR, ".publish.lock")
+
+# Ingestion batching. Chunks and images are embedded in fixed-size batches;
+# pending decoded images are additionally capped by total pixel count so a few
+# huge scans cannot blow up memory before their batch fills.
+TEXT_BATCH_SIZE = int(os.getenv("CLIP_TEXT_BATCH_SIZE", "64"))
+IMAGE_BATCH_SIZE = int(os.getenv("CLIP_IMAGE_BATCH_SIZE", "32"))
+MAX_PENDING_IMAGE_PIXELS = int(os.getenv("CLIP_MAX_PENDING_IMAGE_PIXELS", str(48 * 1024 * 1024)))
+# CLIP pads every text batch to its longest member (capped at 77 tokens), so
+# chunks are bucketed by estimated token count before batching.
+CLIP_MAX_TOKENS = 77
+TEXT_BUCKET_TOKENS = int(os.getenv("CLIP_TEXT_BUCKET_TOKENS", "16"))
+_CHARS_PER_TOKEN = 4
+
+CLIP_MODEL_NAME = "openai/clip-vit-base-patch32"
+
+# Search-side caches: query text -> normalized CLIP vector, and
+# (query, k, index generation) -> hits and image refs (images are read per
+# request, so the bound is on small entries). 0 disables either.
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+# Hybrid retrieval: BM25 over chunk text fused with the CLIP ranking by
+# reciprocal rank fusion. Each side contributes k * HYBRID_CANDIDATES candidates.
+# Off by default (hybrid=true per request); image chunks keep their CLIP rank.
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "false").lower() == "true"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "4"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Filtered searches admitting at most this many chunks are answered exactly
+# from just those vectors; larger selections go to FAISS as an IDSelector.
+FILTER_EXACT_MAX = int(os.getenv("FILTER_EXACT_MAX", "4096"))
+# Largest k a search may ask for; larger values are clamped to it
+SEARCH_K_MAX = int(os.getenv("SEARCH_K_MAX", "100"))
 
-_clip_model: CLIPModel | None = None
-_clip_processor: CLIPProcessor | None = None
+# torch / transformers are imported on first use: they are most of this
+# module's import cost, and processes that import it without embedding
+# (parser workers re-importing the main module, search-only tooling) skip it.
+_clip_model: "CLIPModel | None" = None
+_clip_processor: "CLIPProcessor | None" = None
 
 
 def _ensure_dirs() -> None:
     os.makedirs(STORE_DIR, exist_ok=True)
 
 
-def get_clip() -> Tuple[CLIPModel, CLIPProcessor]:
+def get_clip() -> "Tuple[CLIPModel, CLIPProcessor]":
     global _clip_model, _clip_processor
     if _clip_model is None or _clip_processor is None:
-        _clip_model = CLIPModel.from_pretrained("openai/clip-vit-base-patch32")
+        from transformers import CLIPModel, CLIPProcessor
+
+        _clip_model = CLIPModel.from_pretrained(CLIP_MODEL_NAME)
         _clip_model.eval()
-        _clip_processor = CLIPProcessor.from_pretrained("openai/clip-vit-base-patch32")
+        _clip_processor = CLIPProcessor.from_pretrained(CLIP_MODEL_NAME)
     return _clip_model, _clip_processor
 
 
 def embed_text_clip(texts: List[str]) -> np.ndarray:
+    import torch
+
     model, processor = get_clip()
     with torch.no_grad():
         inputs = processor(text=texts, return_tensors="pt", padding=True, truncation=True, max_length=77)
@@ -48,6 +111,8 @@ def embed_text_clip(texts: List[str]) -> np.ndarray:
 def embed_image_clip(pil_images: List[Image.Image]) -> np.ndarray:
     if not pil_images:
         return np.zeros((0, 512), dtype="float32")
+    import torch
+
     model, processor = get_clip()
     with torch.no_grad():
         inputs = processor(images=pil_images, return_tensors="pt")
@@ -56,103 +121,932 @@ def embed_image_clip(pil_images: List[Image.Image]) -> np.ndarray:
     return feats.cpu().numpy().astype("float32")
 
 
-def _to_base64_png(image: Image.Image) -> str:
-    buf = io.BytesIO()
-    image.save(buf, format="PNG")
-    return base64.b64encode(buf.getvalue()).decode()
+class _EmbeddingBatcher:
+    """
+    Accumulates (Document, item) pairs and embeds them with embed_fn once
+    max_items (or, for images, max_pixels) is reached. Results are appended to
+    the shared docs/vectors lists in matching order.
+
+    Items added with a cache_key are deduplicated within the batch and looked
+    up in / written to the optional persistent embedding cache, so only
+    content that has never been seen is sent to the model.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[Any]], np.ndarray],
+        docs: List[Document],
+        vectors: List[np.ndarray],
+        max_items: int,
+        max_pixels: int | None = None,
+        cache: EmbeddingCache | None = None,
+    ) -> None:
+        self._embed_fn = embed_fn
+        self._docs = docs
+        self._vectors = vectors
+        self._max_items = max(1, max_items)
+        self._max_pixels = max_pixels
+        self._cache = cache
+        self._pending_docs: List[List[Document]] = []
+        self._pending_items: List[Any] = []
+        self._pending_keys: List[str | None] = []
+        self._pending_index: Dict[str, int] = {}
+        self._pending_pixels = 0
+
+    def add(self, doc: Document, item: Any, cache_key: str | None = None) -> None:
+        if cache_key is not None:
+            if cache_key in self._pending_index:
+                # Same content already queued (e.g. a logo repeated on every page)
+                self._pending_docs[self._pending_index[cache_key]].append(doc)
+                return
+            self._pending_index[cache_key] = len(self._pending_items)
+        self._pending_docs.append([doc])
+        self._pending_items.append(item)
+        self._pending_keys.append(cache_key)
+        if isinstance(item, Image.Image):
+            self._pending_pixels += item.width * item.height
+        if len(self._pending_items) >= self._max_items or (
+            self._max_pixels is not None and self._pending_pixels >= self._max_pixels
+        ):
+            self.flush()
+
+    def _embed(self, items: List[Any]) -> List[np.ndarray | None]:
+        try:
+            return list(self._embed_fn(items))
+        except Exception:
+            # One bad item should not drop the whole batch: retry individually
+            results: List[np.ndarray | None] = []
+            for item in items:
+                try:
+                    emb = self._embed_fn([item])
+                except Exception:
+                    emb = None
+                results.append(emb[0] if emb is not None and emb.shape[0] == 1 else None)
+            return results
+
+    def flush(self) -> None:
+        if not self._pending_items:
+            return
+        docs, items, keys = self._pending_docs, self._pending_items, self._pending_keys
+        self._pending_docs, self._pending_items, self._pending_keys = [], [], []
+        self._pending_index, self._pending_pixels = {}, 0
+
+        cached = self._cache.get_many(k for k in keys if k is not None) if self._cache is not None else {}
+        results: List[np.ndarray | None] = [cached.get(k) if k is not None else None for k in keys]
+        todo = [i for i, r in enumerate(results) if r is None]
+        if todo:
+            fresh = self._embed([items[i] for i in todo])
+            for i, emb in zip(todo, fresh):
+                results[i] = emb
+            if self._cache is not None:
+                self._cache.put_many(
+                    {keys[i]: emb for i, emb in zip(todo, fresh) if keys[i] is not None and emb is not None}
+                )
+
+        for item_docs, emb in zip(docs, results):
+            if emb is None:
+                continue
+            for doc in item_docs:
+                self._docs.append(doc)
+                self._vectors.append(emb)
+
+
+class _LengthBucketedBatcher:
+    """
+    Streams text chunks from any number of pages into per-length buckets,
+    each backed by its own _EmbeddingBatcher, so a batch only mixes chunks of
+    similar length and little compute is spent on padding tokens.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], np.ndarray],
+        docs: List[Document],
+        vectors: List[np.ndarray],
+        max_items: int,
+        bucket_tokens: int = TEXT_BUCKET_TOKENS,
+        cache: EmbeddingCache | None = None,
+    ) -> None:
+        self._bucket_tokens = max(1, bucket_tokens)
+        n_buckets = (CLIP_MAX_TOKENS + self._bucket_tokens - 1) // self._bucket_tokens
+        self._buckets = [
+            _EmbeddingBatcher(embed_fn, docs, vectors, max_items, cache=cache) for _ in range(n_buckets)
+        ]
+
+    def _bucket_for(self, text: str) -> int:
+        est_tokens = min(CLIP_MAX_TOKENS - 1, len(text) // _CHARS_PER_TOKEN)
+        return est_tokens // self._bucket_tokens
+
+    def add(self, doc: Document, text: str, cache_key: str | None = None) -> None:
+        self._buckets[self._bucket_for(text)].add(doc, text, cache_key)
+
+    def flush(self) -> None:
+        for bucket in self._buckets:
+            bucket.flush()
 
 
-def build_unified_index(pdf_path: str) -> Dict[str, Any]:
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def doc_id_for_path(pdf_path: str) -> str:
+    """Default document id: the file name without extension, made filename-safe."""
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    return re.sub(r"[^A-Za-z0-9_.-]+", "-", stem).strip("-") or "document"
+
+
+def build_unified_index(
+    pdf_path: str,
+    doc_id: str | None = None,
+    incremental: bool = True,
+    text_batch_size: int | None = None,
+    image_batch_size: int | None = None,
+    progress: Callable[[int, int, int], None] | None = None,
+    file_name: str | None = None,
+) -> Dict[str, Any]:
     """
     Parses a PDF using PyMuPDF, splits text, extracts images, embeds both with CLIP,
-    and builds a unified FAISS index using LangChain's FAISS vectorstore.
-    Persists FAISS locally and a JSON mapping of image_id -> base64 PNG.
+    and adds them to the unified FAISS index using LangChain's FAISS vectorstore.
+    Persists FAISS locally; extracted images go to the content-addressed image store.
+
+    With incremental=True (default) the document is appended to the existing
+    index under doc_id, replacing any previous version of it; re-ingesting an
+    unchanged file (same content hash) is a no-op. With incremental=False the
+    index is rebuilt from this document alone.
+
+    Pages are parsed by a process pool in page-range shards (see
+    services/pdf_parsing.py) while this thread embeds already-parsed pages.
+    Text chunks and images are embedded in batches across pages
+    (TEXT_BATCH_SIZE / IMAGE_BATCH_SIZE unless overridden); text batches are
+    grouped by chunk length to keep padding low. Embeddings already present in
+    the persistent embedding cache are reused instead of recomputed.
+
+    progress(pages_parsed, page_count, vectors_embedded) is called after every
+    page; an exception raised from it aborts the build before anything is
+    published (used for job cancellation).
+
+    file_name is the name recorded for the document (and the default doc_id
+    source) when pdf_path is a temporary copy; defaults to pdf_path's name.
     """
     _ensure_dirs()
+    file_name = file_name or os.path.basename(pdf_path)
+    doc_id = doc_id or doc_id_for_path(file_name)
+    content_hash = _file_sha256(pdf_path)
+
+    if incremental:
+        snapshot = _store.get()
+        existing = snapshot.documents.get(doc_id)
+        if existing and existing.get("content_hash") == content_hash:
+            return {
+                "doc_id": doc_id,
+                "added": 0,
+                "removed": 0,
+                "unchanged": True,
+                "total": _store_size(snapshot.vs),
+                "generation": snapshot.generation,
+            }
 
-    doc = fitz.open(pdf_path)
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
     splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=100)
 
     docs: List[Document] = []
     vectors: List[np.ndarray] = []
-    image_data_store: Dict[str, str] = {}
+    image_refs: Dict[str, str] = {}
+    cache = get_embedding_cache()
+    text_batcher = _LengthBucketedBatcher(
+        embed_text_clip, docs, vectors, text_batch_size or TEXT_BATCH_SIZE, cache=cache
+    )
+    image_batcher = _EmbeddingBatcher(
+        embed_image_clip, docs, vectors, image_batch_size or IMAGE_BATCH_SIZE, MAX_PENDING_IMAGE_PIXELS, cache
+    )
 
-    for page_index, page in enumerate(doc):
+    # Parsing (text, image decode, PNG store) runs in the parser pool, shards
+    # ahead of this loop; this thread only splits text and feeds the batchers.
+    for page in pdf_parsing.iter_pages(pdf_path, page_count, CLIP_MODEL_NAME):
+        page_index = page.page_index
         # Text
-        text = page.get_text() or ""
-        if text.strip():
-            temp_doc = Document(page_content=text, metadata={"page": page_index, "type": "text"})
-            chunks = splitter.split_documents([temp_doc])
-            chunk_texts = [c.page_content for c in chunks]
-            if chunk_texts:
-                text_embs = embed_text_clip(chunk_texts)
-                vectors.extend(list(text_embs))
-                docs.extend(chunks)
+        if page.text.strip():
+            temp_doc = Document(page_content=page.text, metadata={"doc_id": doc_id, "page": page_index, "type": "text"})
+            for chunk in splitter.split_documents([temp_doc]):
+                text_batcher.add(chunk, chunk.page_content, text_key(CLIP_MODEL_NAME, chunk.page_content))
 
         # Images
-        for img_index, img in enumerate(page.get_images(full=True)):
+        for parsed in page.images:
+            image_id = f"{doc_id}_page_{page_index}_img_{parsed.img_index}"
+            image_refs[image_id] = parsed.sha
+            image_batcher.add(
+                Document(
+                    page_content=f"[Image: {image_id}]",
+                    metadata={"doc_id": doc_id, "page": page_index, "type": "image", "image_id": image_id},
+                ),
+                parsed.image,
+                parsed.cache_key,
+            )
+
+        if progress is not None:
+            progress(page_index + 1, page_count, len(vectors))
+
+    text_batcher.flush()
+    image_batcher.flush()
+    if progress is not None:
+        progress(page_count, page_count, len(vectors))
+
+    entry = {
+        "file": file_name,
+        "content_hash": content_hash,
+        "pages": page_count,
+        "ids": [f"{doc_id}:{i}" for i in range(len(docs))],
+        "image_ids": list(image_refs.keys()),
+        "indexed_at": time.time(),
+    }
+    return _merge_document(doc_id, entry, docs, vectors, image_refs, incremental)
+
+
+def _store_size(vs: FAISS | None) -> int:
+    return int(vs.index.ntotal) if vs is not None else 0
+
+
+def _store_positions(
+    vs: FAISS | None, filters: search_filters.FilterIndex | None, doc_id: str, ids: List[str]
+) -> List[int]:
+    """Flat store positions of doc_id's chunks with the given docstore ids."""
+    if vs is None:
+        return []
+    wanted = set(ids)
+    if filters is not None and filters.count == _store_size(vs):
+        candidates = search_filters.document_positions(filters, doc_id)
+    else:
+        candidates = range(_store_size(vs))
+    id_at = vs.docstore.id_at if mmap_store.is_mapped(vs) else vs.index_to_docstore_id.__getitem__
+    return [int(pos) for pos in candidates if id_at(int(pos)) in wanted]
+
+
+def _bm25_text(doc: Document) -> str:
+    # Image chunks only carry a generated "[Image: <id>]" placeholder
+    return "" if doc.metadata.get("type") == "image" else doc.page_content
+
+
+def _derive_positional(
+    module: Any, previous: Any, vs: FAISS | None, removed: Sequence[int], appended: Sequence[Document], item: Callable
+) -> Any:
+    """
+    Position-keyed side index (bm25_index or search_filters) for vs, given the
+    positions removed from previous and the documents appended after them.
+    Only the appended documents are processed unless previous is missing or
+    out of step with vs; item maps a Document to what module indexes.
+    """
+    n = _store_size(vs)
+    if n == 0:
+        return None
+    if previous is None or previous.count - len(removed) + len(appended) != n:
+        return module.build([item(vs.docstore.search(vs.index_to_docstore_id[i])) for i in range(n)])
+    return module.add(module.remove(previous, removed), [item(d) for d in appended])
+
+
+def _derive_bm25(
+    previous: bm25_index.Bm25Index | None, vs: FAISS | None, removed: Sequence[int], appended: Sequence[Document]
+) -> bm25_index.Bm25Index | None:
+    return _derive_positional(bm25_index, previous, vs, removed, appended, _bm25_text)
+
+
+def _derive_filters(
+    previous: search_filters.FilterIndex | None, vs: FAISS | None, removed: Sequence[int], appended: Sequence[Document]
+) -> search_filters.FilterIndex | None:
+    return _derive_positional(search_filters, previous, vs, removed, appended, lambda d: d.metadata)
+
+
+def _derive_ann(
+    previous: ann_index.AnnIndex | None, vs: FAISS | None, appended: int, rebuild: bool
+) -> ann_index.AnnIndex | None:
+    """
+    ANN index for vs, whose last `appended` vectors are new since previous.
+    Appends reuse a copy of previous; deletions shift flat positions, so they
+    (and type changes or IVF outgrowing its training set) rebuild from vs.
+    """
+    n = _store_size(vs)
+    if not ann_index.enabled() or n == 0 or n < ann_index.ANN_MIN_VECTORS:
+        return None
+    if (
+        rebuild
+        or previous is None
+        or not ann_index.matches(previous)
+        or previous.index.ntotal != n - appended
+        or ann_index.needs_retrain(previous, n)
+    ):
+        return ann_index.build(vs.index.reconstruct_n(0, n), reuse=previous)
+    return ann_index.extend(previous, vs.index.reconstruct_n(n - appended, appended))
+
+
+def _merge_document(
+    doc_id: str,
+    entry: Dict[str, Any],
+    docs: List[Document],
+    vectors: List[np.ndarray],
+    image_refs: Dict[str, str],
+    incremental: bool,
+) -> Dict[str, Any]:
+    """
+    Applies one document's vectors to the current generation and publishes
+    the result. Only the merge runs under the publish lock; the expensive
+    parsing/embedding above it does not.
+    """
+    with _publish_lock:
+        snapshot = _store.latest() if incremental else _new_snapshot(None, {}, {}, 0)
+        documents = dict(snapshot.documents)
+        refs = dict(snapshot.image_refs)
+
+        stale_positions: List[int] = []
+        previous = documents.pop(doc_id, None)
+        if previous:
+            stale_positions = _store_positions(snapshot.vs, snapshot.filters, doc_id, previous.get("ids", []))
+            for image_id in previous.get("image_ids", []):
+                refs.pop(image_id, None)
+
+        appended = docs if docs and vectors else []
+        if not appended:
+            if not previous or snapshot.vs is None:
+                return {"doc_id": doc_id, "added": 0, "removed": 0, "total": _store_size(snapshot.vs)}
+        else:
+            refs.update(image_refs)
+            documents[doc_id] = entry
+        published = _publish_generation(
+            snapshot,
+            refs,
+            documents,
+            removed=stale_positions,
+            ids=entry["ids"] if appended else [],
+            docs=appended,
+            vectors=np.stack(vectors).astype("float32") if appended else None,
+        )
+
+    return {
+        "doc_id": doc_id,
+        "added": len(docs),
+        "removed": len(stale_positions),
+        "total": _store_size(published.vs),
+        "generation": published.generation,
+    }
+
+
+def delete_document(doc_id: str) -> Dict[str, Any]:
+    """Removes every vector and image belonging to doc_id and publishes a new generation."""
+    with _publish_lock:
+        snapshot = _store.latest()
+        previous = snapshot.documents.get(doc_id)
+        if previous is None or snapshot.vs is None:
+            return {"doc_id": doc_id, "removed": 0, "found": False}
+        stale_positions = _store_positions(snapshot.vs, snapshot.filters, doc_id, previous.get("ids", []))
+        stale_images = set(previous.get("image_ids", []))
+        refs = {k: v for k, v in snapshot.image_refs.items() if k not in stale_images}
+        documents = {k: v for k, v in snapshot.documents.items() if k != doc_id}
+        published = _publish_generation(snapshot, refs, documents, removed=stale_positions)
+    return {
+        "doc_id": doc_id,
+        "removed": len(stale_positions),
+        "found": True,
+        "total": _store_size(published.vs),
+        "generation": published.generation,
+    }
+
+
+def list_documents() -> Dict[str, Dict[str, Any]]:
+    return dict(_store.get().documents)
+
+
+def get_image_refs() -> Dict[str, str]:
+    """image_id -> sha256 of its file in the image store, for the current generation."""
+    return _store.get().image_refs
+
+
+def get_page_images() -> Dict[Tuple[str | None, int], List[str]]:
+    """(doc_id, page) -> image ids on that page, for the current generation (doc_id None: legacy images)."""
+    return _store.get().page_images
+
+
+def _read_generation() -> int:
+    try:
+        with open(CURRENT_FILE, "r", encoding="utf-8") as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def _generation_stamp() -> Tuple[int, int, int] | None:
+    """Cheap change detector for CURRENT_FILE (one stat, no read)."""
+    try:
+        st = os.stat(CURRENT_FILE)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _generation_dir(generation: int) -> str:
+    return os.path.join(GENERATIONS_DIR, str(generation)) if generation > 0 else STORE_DIR
+
+
+def _ann_paths(generation: int) -> Tuple[str, str]:
+    """(ANN index file, its metadata json) of a generation"""
+    base = _generation_dir(generation)
+    return os.path.join(base, "ann.faiss"), os.path.join(base, "ann.json")
+
+
+def _mapped_store_dir(generation: int) -> str:
+    """Memory-mapped store of a generation (see mmap_store); replaces the pickled faiss dir"""
+    return os.path.join(_generation_dir(generation), "store")
+
+
+def _bm25_dir(generation: int) -> str:
+    return os.path.join(_generation_dir(generation), "bm25")
+
+
+def _filters_dir(generation: int) -> str:
+    return os.path.join(_generation_dir(generation), "filters")
+
+
+def _generation_paths(generation: int) -> Tuple[str, str, str, str]:
+    """(faiss dir, images.json, documents.json, legacy base64 image_data.json)"""
+    if generation <= 0:
+        return (
+            FAISS_DIR,
+            os.path.join(STORE_DIR, "images.json"),
+            os.path.join(STORE_DIR, "documents.json"),
+            IMAGE_DATA_JSON,
+        )
+    gen_dir = os.path.join(GENERATIONS_DIR, str(generation))
+    return (
+        os.path.join(gen_dir, "faiss_lc"),
+        os.path.join(gen_dir, "images.json"),
+        os.path.join(gen_dir, "documents.json"),
+        os.path.join(gen_dir, "image_data.json"),
+    )
+
+
+def _write_atomic(path: str, data: str) -> None:
+    tmp_path = f"{path}.tmp.{os.getpid()}.{threading.get_ident()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _prune_generations(current: int) -> None:
+    # Keep the previous generation around so another process that resolved
+    # CURRENT just before the swap can still finish loading it.
+    if not os.path.isdir(GENERATIONS_DIR):
+        return
+    for name in os.listdir(GENERATIONS_DIR):
+        if name.isdigit() and int(name) <= current - KEEP_GENERATIONS:
+            shutil.rmtree(os.path.join(GENERATIONS_DIR, name), ignore_errors=True)
+
+
+def _read_json(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
+class _Snapshot(NamedTuple):
+    vs: FAISS | None
+    image_refs: Dict[str, str]  # image_id -> sha256 in image_store
+    documents: Dict[str, Dict[str, Any]]
+    generation: int
+    page_images: Dict[Tuple[str | None, int], List[str]]  # (doc_id, page) -> image ids; doc_id None for legacy images
+    ann: ann_index.AnnIndex | None = None  # derived search index; None means exact search on vs
+    bm25: bm25_index.Bm25Index | None = None  # keyword index over the same positions as vs
+    filters: search_filters.FilterIndex | None = None  # document / page / type selections over those positions
+
+
+def _image_page(name: str) -> int | None:
+    """Page number of an image name "page_<n>_img_<m>", or None if it is not one."""
+    parts = name.split("_")
+    if len(parts) >= 4 and parts[0] == "page" and parts[1].isdigit():
+        return int(parts[1])
+    return None
+
+
+def _new_snapshot(
+    vs: FAISS | None,
+    image_refs: Dict[str, str],
+    documents: Dict[str, Dict[str, Any]],
+    generation: int,
+    ann: ann_index.AnnIndex | None = None,
+    bm25: bm25_index.Bm25Index | None = None,
+    filters: search_filters.FilterIndex | None = None,
+) -> _Snapshot:
+    page_images: Dict[Tuple[str | None, int], List[str]] = {}
+    owned = set()
+    for doc_id, entry in documents.items():
+        for image_id in entry.get("image_ids", []):
+            # image ids are "<doc_id>_page_<n>_img_<m>"
+            page = _image_page(image_id[len(doc_id) + 1:])
+            if page is not None:
+                page_images.setdefault((doc_id, page), []).append(image_id)
+            owned.add(image_id)
+    for image_id in image_refs:
+        # legacy stores named images "page_<n>_img_<m>" without a document
+        page = _image_page(image_id) if image_id not in owned else None
+        if page is not None:
+            page_images.setdefault((None, page), []).append(image_id)
+    return _Snapshot(vs, image_refs, documents, generation, page_images, ann, bm25, filters)
+
+
+def _load_generation(generation: int) -> _Snapshot:
+    faiss_dir, images_json, documents_json, legacy_image_json = _generation_paths(generation)
+    if os.path.exists(images_json):
+        image_refs: Dict[str, str] = _read_json(images_json)
+    else:
+        # Stores written before the image store kept base64 PNGs inline
+        image_refs = image_store.import_base64_map(_read_json(legacy_image_json))
+    documents: Dict[str, Dict[str, Any]] = _read_json(documents_json)
+    store_dir = _mapped_store_dir(generation)
+    if mmap_store.exists(store_dir):
+        vs = mmap_store.load(store_dir)
+    elif os.path.isdir(faiss_dir):
+        # Generations written before the memory-mapped format; replaced on the next publish
+        vs = FAISS.load_local(faiss_dir, embeddings=None, allow_dangerous_deserialization=True)
+    else:
+        return _new_snapshot(None, image_refs, documents, generation)
+    ann_path, ann_json = _ann_paths(generation)
+    ann_meta = _read_json(ann_json)
+    if ann_index.matches(ann_meta) and os.path.exists(ann_path):
+        ann = ann_index.read(ann_path, ann_meta)
+    else:
+        # Written with another FAISS_INDEX_TYPE / VECTOR_COMPRESSION (or before ANN support): derive it here
+        ann = _derive_ann(None, vs, 0, rebuild=True)
+    bm25_dir = _bm25_dir(generation)
+    bm25 = bm25_index.load(bm25_dir) if mmap_store.exists(bm25_dir) else None
+    if bm25 is None or bm25.count != _store_size(vs):
+        # Generations written before BM25 support: tokenize the stored chunks here
+        bm25 = _derive_bm25(None, vs, [], [])
+    filters_dir = _filters_dir(generation)
+    filters = search_filters.load(filters_dir) if mmap_store.exists(filters_dir) else None
+    if filters is None or filters.count != _store_size(vs):
+        filters = _derive_filters(None, vs, [], [])
+    return _new_snapshot(vs, image_refs, documents, generation, ann, bm25, filters)
+
+
+class _StoreHandle:
+    """
+    Process-wide handle on the persisted index. The FAISS store and image map
+    are loaded once and kept resident; a new generation published by any
+    process is picked up on the next access. Snapshots are never mutated,
+    only swapped by reference, so in-flight searches keep the one they started with.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # (stamp, snapshot) kept as one reference so readers never pair a new
+        # stamp with an old snapshot.
+        self._current: Tuple[Tuple[int, int, int] | None, _Snapshot] | None = None
+
+    def get(self) -> _Snapshot:
+        stamp = _generation_stamp()
+        current = self._current
+        if current is not None and current[0] == stamp:
+            return current[1]
+        with self._lock:
+            current = self._current
+            if current is not None and current[0] == stamp:
+                return current[1]
             try:
-                xref = img[0]
-                base_image = doc.extract_image(xref)
-                image_bytes = base_image.get("image")
-                pil_image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-
-                image_id = f"page_{page_index}_img_{img_index}"
-                image_data_store[image_id] = _to_base64_png(pil_image)
-
-                img_emb = embed_image_clip([pil_image])
-                if img_emb.shape[0] == 1:
-                    vectors.append(img_emb[0])
-                    docs.append(
-                        Document(
-                            page_content=f"[Image: {image_id}]",
-                            metadata={"page": page_index, "type": "image", "image_id": image_id},
-                        )
-                    )
+                snapshot = _load_generation(_read_generation())
             except Exception:
-                continue
+                if current is None:
+                    raise
+                # Keep serving the last good snapshot; retry on next access.
+                return current[1]
+            self._current = (stamp, snapshot)
+            return snapshot
+
+    def latest(self) -> _Snapshot:
+        """
+        Snapshot of the generation CURRENT_FILE names right now. Writers merge
+        into this under _publish_lock instead of trusting the stat stamp,
+        which another process's publish may not visibly change.
+        """
+        with self._lock:
+            stamp = _generation_stamp()
+            generation = _read_generation()
+            current = self._current
+            if current is not None and current[1].generation == generation:
+                return current[1]
+            snapshot = _load_generation(generation)
+            self._current = (stamp, snapshot)
+            return snapshot
 
-    doc.close()
+    def publish(self, snapshot: _Snapshot) -> None:
+        with self._lock:
+            self._current = (_generation_stamp(), snapshot)
 
-    if not docs or not vectors:
-        # Create an empty store placeholder if needed
-        # but typically return early
-        return {"added": 0, "total": 0}
 
-    embeddings_array = np.stack(vectors).astype("float32")
-    pairs = [(d.page_content, v) for d, v in zip(docs, embeddings_array)]
-    metadatas = [d.metadata for d in docs]
+class _PublishLock:
+    """
+    Re-entrant lock held across threads and processes: a thread RLock, plus
+    an exclusive flock on PUBLISH_LOCK_FILE while the outermost holder is in.
+    """
 
-    vs = FAISS.from_embeddings(text_embeddings=pairs, embedding=None, metadatas=metadatas)
-    vs.save_local(FAISS_DIR)
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file: Any = None
 
-    with open(IMAGE_DATA_JSON, "w", encoding="utf-8") as f:
-        json.dump(image_data_store, f, ensure_ascii=False, indent=2)
+    def __enter__(self) -> "_PublishLock":
+        self._lock.acquire()
+        try:
+            if self._depth == 0 and fcntl is not None:
+                os.makedirs(STORE_DIR, exist_ok=True)
+                self._file = open(PUBLISH_LOCK_FILE, "a+b")
+                try:
+                    fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+                except BaseException:
+                    self._file.close()
+                    self._file = None
+                    raise
+        except BaseException:
+            self._lock.release()
+            raise
+        self._depth += 1
+        return self
 
-    return {"added": len(docs), "total": len(docs)}
+    def __exit__(self, *exc: Any) -> None:
+        self._depth -= 1
+        if self._depth == 0 and self._file is not None:
+            # closing the file releases the flock
+            self._file.close()
+            self._file = None
+        self._lock.release()
 
 
-def _load_store() -> Tuple[FAISS | None, Dict[str, str]]:
-    _ensure_dirs()
-    img_map: Dict[str, str] = {}
-    if os.path.exists(IMAGE_DATA_JSON):
+_store = _StoreHandle()
+_publish_lock = _PublishLock()
+
+
+def _publish_generation(
+    base: _Snapshot,
+    image_refs: Dict[str, str],
+    documents: Dict[str, Dict[str, Any]],
+    removed: Sequence[int] = (),
+    ids: Sequence[str] = (),
+    docs: Sequence[Document] = (),
+    vectors: np.ndarray | None = None,
+) -> _Snapshot:
+    """
+    Writes a complete new generation directory: base's store with the chunks
+    at positions removed dropped and docs (ids, vectors) appended, plus the
+    side indexes derived incrementally from base's. Then flips CURRENT_FILE
+    to it. Readers only ever resolve fully written generations.
+    """
+    with _publish_lock:
+        os.makedirs(GENERATIONS_DIR, exist_ok=True)
+        generation = _read_generation() + 1
+        while True:
+            gen_dir = os.path.join(GENERATIONS_DIR, str(generation))
+            try:
+                os.makedirs(gen_dir)
+                break
+            except FileExistsError:
+                generation += 1
         try:
-            with open(IMAGE_DATA_JSON, "r", encoding="utf-8") as f:
-                img_map = json.load(f)
-        except Exception:
-            img_map = {}
-    if not os.path.isdir(FAISS_DIR):
-        return None, img_map
-    vs = FAISS.load_local(FAISS_DIR, embeddings=None, allow_dangerous_deserialization=True)
-    return vs, img_map
+            store_dir = _mapped_store_dir(generation)
+            mmap_store.write(base.vs, store_dir, removed, ids, docs, vectors)
+            # Everything is derived from, and served by, the mapped files, so no
+            # heap copy of the store is built and the page cache is shared
+            vs = mmap_store.load(store_dir)
+            ann = _derive_ann(base.ann, vs, len(docs), rebuild=bool(removed))
+            bm25 = _derive_bm25(base.bm25, vs, removed, docs)
+            filters = _derive_filters(base.filters, vs, removed, docs)
+            _, images_json, documents_json, _ = _generation_paths(generation)
+            with open(images_json, "w", encoding="utf-8") as f:
+                json.dump(image_refs, f, ensure_ascii=False, indent=2)
+            with open(documents_json, "w", encoding="utf-8") as f:
+                json.dump(documents, f, ensure_ascii=False, indent=2)
+            if ann is not None:
+                ann_path, ann_json = _ann_paths(generation)
+                with open(ann_json, "w", encoding="utf-8") as f:
+                    ann_meta = ann_index.write(ann, ann_path)
+                    json.dump(ann_meta, f)
+                ann = ann_index.read(ann_path, ann_meta)
+            if bm25 is not None:
+                bm25_dir = _bm25_dir(generation)
+                bm25_index.write(bm25, bm25_dir)
+                bm25 = bm25_index.load(bm25_dir)
+            if filters is not None:
+                filters_dir = _filters_dir(generation)
+                search_filters.write(filters, filters_dir)
+                filters = search_filters.load(filters_dir)
+        except BaseException:
+            shutil.rmtree(gen_dir, ignore_errors=True)
+            raise
+        _write_atomic(CURRENT_FILE, str(generation))
+        snapshot = _new_snapshot(vs, image_refs, documents, generation, ann, bm25, filters)
+        _store.publish(snapshot)
+        _prune_generations(generation)
+        _collect_images()
+    return snapshot
 
 
-def search_unified_lc(query: str, k: int = 5) -> Dict[str, Any]:
-    vs, img_map = _load_store()
-    if vs is None:
-        return {"hits": [], "images": img_map}
-    q_vec = embed_text_clip([query])[0]
-    results = vs.similarity_search_by_vector(embedding=q_vec, k=k)
+def _collect_images() -> None:
+    """Deletes image files no retained generation refers to."""
+    referenced = set()
+    if os.path.isdir(GENERATIONS_DIR):
+        for name in os.listdir(GENERATIONS_DIR):
+            if name.isdigit():
+                images_json = _generation_paths(int(name))[1]
+                referenced.update(_read_json(images_json).values())
+    image_store.remove_unreferenced(referenced)
+
+
+
+def current_generation() -> int:
+    return _store.get().generation
+
+
+_query_vectors = LRUCache(QUERY_CACHE_SIZE)
+_query_results = LRUCache(RESULT_CACHE_SIZE)
+_results_generation: int | None = None
+
+
+def embed_query(query: str) -> np.ndarray:
+    """CLIP text vector for a search query, served from the in-process LRU when repeated."""
+    q_vec = _query_vectors.get(query)
+    if q_vec is None:
+        q_vec = embed_text_clip([query])[0]
+        _query_vectors.put(query, q_vec)
+    return q_vec
+
+
+def embed_queries(queries: List[str]) -> np.ndarray:
+    """CLIP text vectors for several queries; all cache misses go to the model in one call."""
+    vectors: Dict[str, np.ndarray] = {}
+    for query in queries:
+        q_vec = _query_vectors.get(query)
+        if q_vec is not None:
+            vectors[query] = q_vec
+    missing = [q for q in dict.fromkeys(queries) if q not in vectors]
+    if missing:
+        for query, q_vec in zip(missing, embed_text_clip(missing)):
+            _query_vectors.put(query, q_vec)
+            vectors[query] = q_vec
+    return np.stack([vectors[q] for q in queries])
+
+
+def query_cache_stats() -> Dict[str, Dict[str, int]]:
+    return {"query_vectors": _query_vectors.stats(), "results": _query_results.stats()}
+
+
+def index_status() -> Dict[str, Any]:
+    """Readiness details: whether CLIP is loaded, and size/generation of the published index."""
+    snapshot = _store.get()
+    return {
+        "model_loaded": _clip_model is not None,
+        "vectors": _store_size(snapshot.vs),
+        "documents": len(snapshot.documents),
+        "generation": snapshot.generation,
+        "ann": ann_index.describe(snapshot.ann),
+        "bm25": bm25_index.describe(snapshot.bm25),
+        "filters": search_filters.describe(snapshot.filters),
+    }
+
+
+def _cache_events() -> Dict[Tuple[str, str], int]:
+    events: Dict[Tuple[str, str], int] = {}
+    caches = dict(query_cache_stats())
+    embedding_cache = get_embedding_cache()
+    if embedding_cache is not None:
+        caches["embeddings"] = embedding_cache.stats()
+    for name, stats in caches.items():
+        for event in ("hits", "misses", "evictions"):
+            if event in stats:
+                events[(name, event)] = stats[event]
+    return events
+
+
+metrics.gauge(
+    "recall_cache_events_total",
+    "Hits/misses/evictions of the search and embedding caches",
+    _cache_events,
+    ("cache", "event"),
+    kind="counter",
+)
+metrics.gauge("recall_index_vectors", "Vectors in the published index", lambda: index_status()["vectors"])
+metrics.gauge("recall_index_generation", "Published index generation", current_generation)
+
+
+def _hit_image_ids(snapshot: _Snapshot, hits: List[Dict[str, Any]], neighbourhood: int | None) -> List[str]:
+    """
+    Image ids referenced by the hits, in rank order. With neighbourhood=n,
+    images on pages within n pages of any hit (same document) are added too.
+    """
+    image_ids = [h["metadata"]["image_id"] for h in hits if h["metadata"].get("image_id")]
+    if neighbourhood is not None and neighbourhood >= 0:
+        for h in hits:
+            doc_id, page = h["metadata"].get("doc_id"), h["metadata"].get("page")
+            if doc_id is None or page is None:
+                continue
+            for p in range(page - neighbourhood, page + neighbourhood + 1):
+                image_ids.extend(snapshot.page_images.get((doc_id, p), []))
+    return list(dict.fromkeys(image_ids))
+
+
+def _search_positions(
+    snapshot: _Snapshot,
+    q_vecs: np.ndarray,
+    k: int,
+    nprobe: int | None = None,
+    ef_search: int | None = None,
+    selected: search_filters.Selection | None = None,
+) -> np.ndarray:
+    """
+    Flat store positions nearest to each row of q_vecs (-1 padded), in one
+    FAISS call: through the ANN index when there is one, else exact. With a
+    filter selection, only positions it admits are returned.
+    """
+    q_vecs = np.ascontiguousarray(q_vecs, dtype="float32")
+    sel = bits = None
+    if selected is not None:
+        if selected.size() <= FILTER_EXACT_MAX:
+            return _search_subset(snapshot.vs, q_vecs, k, selected.to_positions())
+        # bits must outlive the search: the selector may only point at them
+        sel, bits = search_filters.id_selector(selected)
+    if snapshot.ann is None:
+        params = faiss.SearchParameters(sel=sel) if sel is not None else None
+        _, positions = snapshot.vs.index.search(q_vecs, k, params=params)
+    else:
+        _, positions = ann_index.search(
+            snapshot.ann, q_vecs, k, nprobe=nprobe, ef_search=ef_search, sel=sel, exact=snapshot.vs.index
+        )
+    del bits
+    return positions
+
+
+def _search_subset(vs: FAISS, q_vecs: np.ndarray, k: int, chosen: np.ndarray) -> np.ndarray:
+    """Exact search over just the chosen positions' vectors, for narrow filters."""
+    positions = np.full((len(q_vecs), k), -1, dtype="int64")
+    if len(chosen):
+        vectors = vs.index.reconstruct_batch(chosen.astype("int64"))
+        _, found = faiss.knn(q_vecs, vectors, min(k, len(chosen)))
+        positions[:, : found.shape[1]] = np.where(found >= 0, chosen[np.maximum(found, 0)], -1)
+    return positions
+
+
+def _reciprocal_rank_fusion(rankings: List[Any], k: int) -> List[int]:
+    """Top-k positions by sum of 1 / (RRF_K + rank) over the rankings; ties keep first-seen order."""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, pos in enumerate((int(p) for p in ranking if p >= 0), start=1):
+            scores[pos] = scores.get(pos, 0.0) + 1.0 / (RRF_K + rank)
+    return sorted(scores, key=scores.__getitem__, reverse=True)[:k]
+
+
+def _hybrid_ranking(
+    filters: search_filters.FilterIndex | None, dense: np.ndarray, lexical: np.ndarray, k: int
+) -> List[int]:
+    """
+    Top-k of the CLIP ranking dense fused with the BM25 ranking lexical.
+    Image chunks have no text for BM25 to score, so they keep the slots CLIP
+    ranks them in; the other slots are filled with text chunks by reciprocal
+    rank fusion of both rankings.
+    """
+    dense = dense[dense >= 0]
+    is_image = (
+        search_filters.has_type(filters, dense, "image") if filters is not None else np.zeros(len(dense), dtype=bool)
+    )
+    text = iter(_reciprocal_rank_fusion([dense[~is_image], lexical], k))
+    ranked: List[int] = []
+    for pos, image in zip(dense[:k], is_image[:k]):
+        pos = int(pos) if image else next(text, None)
+        if pos is not None:
+            ranked.append(pos)
+    ranked.extend(text)
+    return ranked[:k]
+
+
+def _documents_at(vs: FAISS, positions: Any) -> List[Document]:
+    docs = []
+    for pos in positions:
+        if pos < 0:
+            continue  # fewer than k candidates in the probed lists
+        doc = vs.docstore.search(vs.index_to_docstore_id[int(pos)])
+        if isinstance(doc, Document):
+            docs.append(doc)
+    return docs
+
+
+def _search_result(snapshot: _Snapshot, results: List[Document], image_neighbourhood: int | None) -> Dict[str, Any]:
+    """
+    Cacheable part of the response for one query: the hits and the refs of
+    the images they reference. Image bytes are added by _with_images.
+    """
     # Convert Documents to simple dicts
     hits: List[Dict[str, Any]] = []
     for rank, d in enumerate(results, start=1):
@@ -163,6 +1057,106 @@ def search_unified_lc(query: str, k: int = 5) -> Dict[str, Any]:
                 "metadata": d.metadata,
             }
         )
-    return {"hits": hits, "images": img_map}
+    image_ids = _hit_image_ids(snapshot, hits, image_neighbourhood)
+    return {
+        "hits": hits,
+        # image_id -> sha256, for serving the stored file by URL
+        "image_refs": {i: snapshot.image_refs[i] for i in image_ids if i in snapshot.image_refs},
+    }
+
+
+def _with_images(snapshot: _Snapshot, result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Response for a (possibly cached) result: a new dict with the base64
+    images read from the image store. Images are never cached, so the result
+    cache's memory grows with hits rather than with image sizes.
+    """
+    # Only the images the hits point at are read from the image store
+    with metrics.STAGE_SECONDS.time(stage="image_materialization"):
+        images = image_store.read_base64(snapshot.image_refs, result["image_refs"])
+    return {"hits": result["hits"], "images": images, "image_refs": result["image_refs"]}
+
+
+def search_unified_lc(
+    query: str,
+    k: int = 5,
+    image_neighbourhood: int | None = None,
+    nprobe: int | None = None,
+    ef_search: int | None = None,
+    hybrid: bool | None = None,
+    search_filter: search_filters.SearchFilter | None = None,
+) -> Dict[str, Any]:
+    """
+    Top-k hits for query. "images" only holds the images referenced by those
+    hits (plus, with image_neighbourhood=n, images on pages within n pages of a
+    hit), so the response grows with k rather than with the corpus.
+    nprobe / ef_search override the IVF / HNSW search breadth for this query;
+    hybrid overrides HYBRID_SEARCH (BM25 + CLIP fused by reciprocal rank);
+    search_filter restricts hits to given documents, page range and chunk types.
+    """
+    return search_unified_lc_batch([query], k, image_neighbourhood, nprobe, ef_search, hybrid, search_filter)[0]
+
+
+def search_unified_lc_batch(
+    queries: List[str],
+    k: int = 5,
+    image_neighbourhood: int | None = None,
+    nprobe: int | None = None,
+    ef_search: int | None = None,
+    hybrid: bool | None = None,
+    search_filter: search_filters.SearchFilter | None = None,
+) -> List[Dict[str, Any]]:
+    """
+    search_unified_lc for several queries, one result per query in order.
+    Queries not in the result cache are embedded in one CLIP call and searched
+    with one FAISS call, instead of one of each per query.
+
+    k is clamped to SEARCH_K_MAX; k < 1 raises ValueError.
+    """
+    global _results_generation
+    if k < 1:
+        raise ValueError(f"k must be at least 1, got {k}")
+    k = min(k, SEARCH_K_MAX)
+    _ensure_dirs()
+    snapshot = _store.get()
+    if snapshot.vs is None:
+        return [{"hits": [], "images": {}, "image_refs": {}} for _ in queries]
 
+    if _results_generation != snapshot.generation:
+        # Results from an older index are unreachable now; free them
+        _query_results.clear()
+        _results_generation = snapshot.generation
+    hybrid = (HYBRID_SEARCH if hybrid is None else hybrid) and snapshot.bm25 is not None
+    if search_filter is not None and not search_filter.active():
+        search_filter = None
+    options = (k, image_neighbourhood, nprobe, ef_search, hybrid, search_filter, snapshot.generation)
+    results: List[Dict[str, Any] | None] = []
+    for query in queries:
+        results.append(_query_results.get((query, *options)))
+    missing = list(dict.fromkeys(q for q, r in zip(queries, results) if r is None))
+    if missing:
+        depth = k * max(1, HYBRID_CANDIDATES) if hybrid else k
+        selected = None
+        if search_filter is not None:
+            if snapshot.filters is None:
+                return [{"hits": [], "images": {}, "image_refs": {}} for _ in queries]
+            selected = search_filters.select(snapshot.filters, search_filter)
+        with metrics.STAGE_SECONDS.time(stage="query_embedding"):
+            q_vecs = embed_queries(missing)
+        with metrics.STAGE_SECONDS.time(stage="faiss_search"):
+            ranked = list(_search_positions(snapshot, q_vecs, depth, nprobe, ef_search, selected))
+        if hybrid:
+            with metrics.STAGE_SECONDS.time(stage="bm25_search"):
+                keyword = [bm25_index.search(snapshot.bm25, query, depth, selected)[1] for query in missing]
+            ranked = [
+                _hybrid_ranking(snapshot.filters, dense, lexical, k) for dense, lexical in zip(ranked, keyword)
+            ]
+        fresh = {}
+        for query, positions in zip(missing, ranked):
+            result = _search_result(snapshot, _documents_at(snapshot.vs, positions), image_neighbourhood)
+            _query_results.put((query, *options), result)
+            fresh[query] = result
+        results = [r if r is not None else fresh[q] for q, r in zip(queries, results)]
+    # Callers add keys (e.g. image_paths) to the response; _with_images returns new dicts
+    return [_with_images(snapshot, r) for r in results]
 
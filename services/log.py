@@ -0,0 +1,139 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import reprlib
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict
+
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text | json
+# Fraction of DEBUG records kept; INFO and above are never sampled
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "1.0"))
+# Records waiting for the writer thread; beyond this new records are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_MAX_CHARS = int(os.getenv("LOG_MAX_CHARS", "300"))
+
+_STANDARD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class _BoundedRepr(reprlib.Repr):
+    def __init__(self, max_chars: int) -> None:
+        super().__init__()
+        self.maxstring = max_chars
+        self.maxother = max_chars
+        self.maxdict = 12
+        self.maxlist = 12
+        self.maxlevel = 3
+
+
+class Truncated:
+    """
+    Log argument that renders value in at most max_chars characters, walking
+    only as much of it as it prints; so logging a payload with megabytes of
+    base64 images costs about the same as logging a short string. Nothing is
+    rendered unless the record is actually emitted.
+    """
+
+    __slots__ = ("value", "max_chars")
+
+    def __init__(self, value: Any, max_chars: int = LOG_MAX_CHARS) -> None:
+        self.value = value
+        self.max_chars = max_chars
+
+    def __str__(self) -> str:
+        if isinstance(self.value, str):
+            text = self.value
+        else:
+            text = _BoundedRepr(self.max_chars).repr(self.value)
+        if len(text) > self.max_chars:
+            return f"{text[: self.max_chars]}...(+{len(text) - self.max_chars} chars)"
+        return text
+
+    __repr__ = __str__
+
+
+def truncate(value: Any, max_chars: int = LOG_MAX_CHARS) -> Truncated:
+    return Truncated(value, max_chars)
+
+
+class _SamplingFilter(logging.Filter):
+    def __init__(self, debug_rate: float) -> None:
+        super().__init__()
+        self.debug_rate = debug_rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or self.debug_rate >= 1.0 or random.random() < self.debug_rate
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Never blocks the caller: when the writer falls behind, records are dropped and counted."""
+
+    dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; fields passed via extra= become top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+_listener: QueueListener | None = None
+_configure_lock = threading.Lock()
+
+
+def configure_logging() -> None:
+    """
+    Routes the root logger through a bounded queue to a single writer thread,
+    so request threads never wait on stderr. Safe to call more than once.
+    """
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+        stream = logging.StreamHandler()
+        if LOG_FORMAT == "json":
+            stream.setFormatter(JsonFormatter())
+        else:
+            stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        handler = _DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        handler.addFilter(_SamplingFilter(LOG_DEBUG_SAMPLE_RATE))
+        root = logging.getLogger()
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(handler)
+        _listener = QueueListener(handler.queue, stream, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    configure_logging()
+    return logging.getLogger(name)
+
+
+def dropped_records() -> int:
+    return _DroppingQueueHandler.dropped
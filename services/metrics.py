@@ -0,0 +1,194 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
+
+# Seconds; spans sub-millisecond cache hits up to the 60s AI response wait
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> None:
+        super().__init__(name, help_text, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, k)} {v:g}" for k, v in items]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram; observe() is a bisect and three additions under a lock."""
+
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, help_text: str, label_names: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> (per-bucket counts incl. +Inf, sum, count)
+        self._series: Dict[LabelValues, List[Any]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(s[0]), s[1], s[2]) for k, s in self._series.items()]
+        lines = []
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, n in zip((*self.buckets, float("inf")), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                labels = _format_labels(self.label_names, key, 'le="%s"' % le)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {total:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    Read at scrape time from fn(), which returns a number or {label value
+    tuple: number}. kind="counter" exports totals some other object keeps.
+    """
+
+    def __init__(
+        self, name: str, help_text: str, fn: Callable[[], Any], label_names: Tuple[str, ...] = (), kind: str = "gauge"
+    ) -> None:
+        super().__init__(name, help_text, label_names)
+        self._fn = fn
+        self.kind = kind
+
+    def _samples(self) -> List[str]:
+        try:
+            value = self._fn()
+        except Exception:
+            return []
+        if not isinstance(value, dict):
+            return [f"{self.name} {float(value):g}"]
+        return [f"{self.name}{_format_labels(self.label_names, k)} {float(v):g}" for k, v in value.items()]
+
+
+_registry: Dict[str, _Metric] = {}
+_registry_lock = threading.Lock()
+
+
+def _register(metric: _Metric) -> Any:
+    with _registry_lock:
+        # Modules may be imported by several apps; keep the first registration
+        return _registry.setdefault(metric.name, metric)
+
+
+def counter(name: str, help_text: str, label_names: Tuple[str, ...] = ()) -> Counter:
+    return _register(Counter(name, help_text, label_names))
+
+
+def histogram(name: str, help_text: str, label_names: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help_text, label_names, buckets))
+
+
+def gauge(
+    name: str, help_text: str, fn: Callable[[], Any], label_names: Tuple[str, ...] = (), kind: str = "gauge"
+) -> Gauge:
+    with _registry_lock:
+        metric = _registry[name] = Gauge(name, help_text, fn, label_names, kind)
+    return metric
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines: List[str] = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Shared by the pipeline and the apps; stage is one of query_embedding,
+# faiss_search, image_materialization, webhook, ai_response_wait, clipboard.
+STAGE_SECONDS = histogram("recall_stage_seconds", "Time spent per request stage", ("stage",))
+REQUEST_SECONDS = histogram("recall_http_request_seconds", "HTTP request latency", ("endpoint", "status"))
+AI_RESPONSE_TIMEOUTS = counter("recall_ai_response_timeouts_total", "Chats that gave up waiting for the AI agent")
+WEBHOOK_ERRORS = counter("recall_webhook_errors_total", "Failed webhook posts", ("kind",))
+
+
+def instrument_flask(app: Any) -> None:
+    """Records REQUEST_SECONDS for every request of a Flask app, labelled by endpoint and status."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_timer() -> None:
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_latency(response: Any) -> Any:
+        start = g.pop("_metrics_start", None)
+        if start is not None:
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - start, endpoint=request.endpoint or "unknown", status=str(response.status_code)
+            )
+        return response
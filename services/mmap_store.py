@@ -0,0 +1,273 @@
+import json
+import os
+from typing import Any, Dict, Iterator, List, Mapping, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+
+# On-disk layout of one store directory. Nothing on the load path is pickled:
+#   manifest.json             {"format", "count", "dim"}
+#   vectors.faiss             flat index, memory-mapped where faiss supports it (see read_index)
+#   page.npy                  int32 column, -1 when a chunk has no page
+#   <col>.offsets.npy / .bin  string columns: int64 offsets into a utf-8 blob
+# All columns are memory-mapped, so every worker process shares one copy in
+# the page cache and loading costs a few opens regardless of corpus size.
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+_STRING_COLUMNS = ("id", "text", "doc_id", "type", "image_id", "extra")
+_KNOWN_METADATA = ("doc_id", "page", "type", "image_id")
+
+
+def write_manifest(directory: str, version: int, **fields: Any) -> None:
+    """
+    Writes directory's manifest.json. Every writer calls this last: a
+    directory without a manifest is incomplete.
+    """
+    with open(os.path.join(directory, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump({"format": version, **fields}, f, ensure_ascii=False)
+
+
+def read_manifest(directory: str, version: int) -> Dict[str, Any]:
+    with open(os.path.join(directory, MANIFEST), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != version:
+        raise ValueError(f"Unsupported format {manifest.get('format')} in {directory}")
+    return manifest
+
+
+def exists(directory: str) -> bool:
+    return os.path.exists(os.path.join(directory, MANIFEST))
+
+
+def save_arrays(directory: str, arrays: Dict[str, Any]) -> None:
+    """One <name>.npy per array, for load_arrays."""
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, f"{name}.npy"), np.asarray(array))
+
+
+def load_arrays(directory: str, names: Sequence[str]) -> Dict[str, np.ndarray]:
+    return {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in names}
+
+
+def owned_copy(index: faiss.Index) -> faiss.Index:
+    """
+    Heap copy of index. Memory-mapped indexes only view their storage and
+    abort on add(); clone_index keeps the view, a serialize round-trip does not.
+    """
+    return faiss.deserialize_index(faiss.serialize_index(index))
+
+
+# IO_FLAG_MMAP_IFC (faiss >= 1.11) maps flat codes too; older IO_FLAG_MMAP
+# maps only what those versions can map (IVF lists) and reads the rest
+_MMAP_FLAGS = tuple(
+    getattr(faiss, name) for name in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP") if hasattr(faiss, name)
+)
+
+
+def read_index(path: str) -> faiss.Index:
+    """Opens a FAISS index file zero-copy where the index type and faiss version allow it."""
+    for flags in _MMAP_FLAGS:
+        try:
+            return faiss.read_index(path, flags)
+        except RuntimeError:
+            continue
+    return faiss.read_index(path)
+
+
+class StringColumn:
+    """Memory-mapped column of strings written by write_string_column."""
+
+    def __init__(self, directory: str, name: str) -> None:
+        self.offsets = np.load(os.path.join(directory, f"{name}.offsets.npy"), mmap_mode="r")
+        blob_path = os.path.join(directory, f"{name}.bin")
+        # np.memmap cannot map an empty file
+        if os.path.getsize(blob_path):
+            self.blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+        else:
+            self.blob = np.zeros(0, dtype=np.uint8)
+
+    def __getitem__(self, i: int) -> str:
+        return self.blob[self.offsets[i] : self.offsets[i + 1]].tobytes().decode("utf-8")
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+def write_string_column(directory: str, name: str, values: List[str]) -> None:
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    np.save(os.path.join(directory, f"{name}.offsets.npy"), offsets)
+    with open(os.path.join(directory, f"{name}.bin"), "wb") as f:
+        f.write(b"".join(encoded))
+
+
+class ColumnarDocstore(Docstore):
+    """
+    Read-only docstore over the memory-mapped columns, keyed by index position.
+    Documents are built on demand, so only search hits are ever decoded.
+    """
+
+    def __init__(self, directory: str, count: int) -> None:
+        self.count = count
+        self._columns = {name: StringColumn(directory, name) for name in _STRING_COLUMNS}
+        self._page = load_arrays(directory, ["page"])["page"]
+
+    def id_at(self, position: int) -> str:
+        return self._columns["id"][position]
+
+    def document_at(self, position: int) -> Document:
+        columns = self._columns
+        metadata: Dict[str, Any] = {}
+        extra = columns["extra"][position]
+        if extra:
+            metadata.update(json.loads(extra))
+        for key in ("doc_id", "type", "image_id"):
+            value = columns[key][position]
+            if value:
+                metadata[key] = value
+        page = int(self._page[position])
+        if page >= 0:
+            metadata["page"] = page
+        return Document(page_content=columns["text"][position], metadata=metadata)
+
+    def search(self, search: Any) -> Document | str:
+        try:
+            position = int(search)
+        except (TypeError, ValueError):
+            return f"ID {search} not found."
+        if not 0 <= position < self.count:
+            return f"ID {search} not found."
+        return self.document_at(position)
+
+
+class _PositionIds(Mapping):
+    """index_to_docstore_id for a ColumnarDocstore: each position is its own key."""
+
+    def __init__(self, count: int) -> None:
+        self.count = count
+
+    def __getitem__(self, position: int) -> int:
+        if not 0 <= position < self.count:
+            raise KeyError(position)
+        return position
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self.count))
+
+    def __len__(self) -> int:
+        return self.count
+
+
+def is_mapped(vs: FAISS) -> bool:
+    return isinstance(vs.docstore, ColumnarDocstore)
+
+
+def _row(doc_key: Any, doc: Document) -> Tuple[Dict[str, str], int]:
+    """(string column values, page) of one chunk"""
+    metadata = dict(doc.metadata)
+    values = {"id": str(doc_key), "text": doc.page_content}
+    for key in ("doc_id", "type", "image_id"):
+        value = metadata.get(key)
+        values[key] = "" if value is None else str(value)
+    page = metadata.get("page")
+    extra = {k: v for k, v in metadata.items() if k not in _KNOWN_METADATA}
+    values["extra"] = json.dumps(extra, ensure_ascii=False, default=str) if extra else ""
+    return values, int(page) if isinstance(page, int) else -1
+
+
+def _encoded_columns(rows: List[Tuple[Dict[str, str], int]]) -> Tuple[Dict[str, Tuple[np.ndarray, Any]], np.ndarray]:
+    """Rows as {column: (offsets, utf-8 blob)} and the page column."""
+    columns = {}
+    for name in _STRING_COLUMNS:
+        encoded = [values[name].encode("utf-8") for values, _ in rows]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        columns[name] = (offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8))
+    return columns, np.asarray([page for _, page in rows], dtype=np.int32)
+
+
+def _store_columns(vs: FAISS | None) -> Tuple[Dict[str, Tuple[np.ndarray, Any]], np.ndarray]:
+    """Columns of vs: the mapped arrays themselves, or encoded from an in-memory docstore."""
+    if vs is not None and is_mapped(vs):
+        columns = vs.docstore._columns
+        return {name: (columns[name].offsets, columns[name].blob) for name in _STRING_COLUMNS}, vs.docstore._page
+    rows = []
+    if vs is not None:
+        for position in range(vs.index.ntotal):
+            doc_key = vs.index_to_docstore_id[position]
+            rows.append(_row(doc_key, vs.docstore.search(doc_key)))
+    return _encoded_columns(rows)
+
+
+def _write_updated_column(
+    directory: str, name: str, offsets: np.ndarray, blob: Any, keep: np.ndarray | None, appended: Tuple[np.ndarray, Any]
+) -> None:
+    """Writes a string column with the rows keep drops removed and appended's rows added, as array copies."""
+    lengths = np.diff(offsets)
+    if keep is not None:
+        # the kept rows' bytes, in one pass over the blob
+        blob = np.asarray(blob)[np.repeat(keep, lengths)]
+        lengths = lengths[keep]
+    new_offsets = np.zeros(len(lengths) + len(appended[0]), dtype=np.int64)
+    np.cumsum(np.concatenate([lengths, np.diff(appended[0])]), out=new_offsets[1:])
+    np.save(os.path.join(directory, f"{name}.offsets.npy"), new_offsets)
+    with open(os.path.join(directory, f"{name}.bin"), "wb") as f:
+        f.write(memoryview(np.ascontiguousarray(blob)))
+        f.write(memoryview(appended[1]))
+
+
+def write(
+    vs: FAISS | None,
+    directory: str,
+    removed: Sequence[int] = (),
+    ids: Sequence[str] = (),
+    docs: Sequence[Document] = (),
+    vectors: np.ndarray | None = None,
+) -> None:
+    """
+    Writes vs (mapped, in-memory or None) as a store directory, which must
+    not exist yet, with the chunks at positions removed dropped (later chunks
+    shift down) and docs appended under ids with their vectors. For a mapped
+    vs this copies columns as arrays: no Document is built for existing
+    chunks, so the cost is a copy of the files, not Python work per chunk.
+    """
+    os.makedirs(directory)
+    columns, pages = _store_columns(vs)
+    appended, appended_pages = _encoded_columns([_row(i, d) for i, d in zip(ids, docs)])
+    keep = None
+    if len(removed):
+        keep = np.ones(len(pages), dtype=bool)
+        keep[np.asarray(removed, dtype=np.int64)] = False
+    for name, (offsets, blob) in columns.items():
+        _write_updated_column(directory, name, offsets, blob, keep, appended[name])
+    kept_pages = np.asarray(pages) if keep is None else np.asarray(pages)[keep]
+    save_arrays(directory, {"page": np.concatenate([kept_pages, appended_pages])})
+
+    if vs is None:
+        index = faiss.IndexFlatL2(vectors.shape[1])
+    elif len(removed) or vectors is not None and len(vectors):
+        index = owned_copy(vs.index)
+    else:
+        index = vs.index
+    if len(removed):
+        index.remove_ids(faiss.IDSelectorBatch(np.asarray(removed, dtype=np.int64)))
+    if vectors is not None and len(vectors):
+        index.add(np.ascontiguousarray(vectors, dtype=np.float32))
+    faiss.write_index(index, os.path.join(directory, "vectors.faiss"))
+    write_manifest(directory, FORMAT_VERSION, count=int(index.ntotal), dim=int(index.d))
+
+
+def load(directory: str) -> FAISS:
+    """Opens a store directory without reading vectors or metadata into memory."""
+    count = int(read_manifest(directory, FORMAT_VERSION)["count"])
+    return FAISS(
+        embedding_function=None,
+        index=read_index(os.path.join(directory, "vectors.faiss")),
+        docstore=ColumnarDocstore(directory, count),
+        index_to_docstore_id=_PositionIds(count),
+    )
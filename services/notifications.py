@@ -0,0 +1,125 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Tuple
+
+
+class NotificationDispatcher:
+    """
+    Fire-and-forget delivery of webhook notifications on a background thread,
+    so request latency does not depend on the webhook.
+
+    At most max_queue notifications wait; when full, the oldest queued one is
+    dropped (drop_policy="oldest") or the new one is refused ("newest").
+    Notifications sharing a coalesce_key replace each other while queued, so
+    a burst of identical searches is sent once with the latest payload. With
+    batch_size > 1, up to batch_size queued notifications (waiting at most
+    batch_wait seconds for more) go out as one {"event": "batch", "events": [...]}
+    post; with 1 (default) every notification is posted as-is.
+
+    post_fn(payload) returns the webhook result dict; a result with "error"
+    or posted=False counts as a failed delivery.
+    """
+
+    def __init__(
+        self,
+        post_fn: Callable[[Dict[str, Any]], Dict[str, Any]],
+        max_queue: int = 256,
+        batch_size: int = 1,
+        batch_wait: float = 0.05,
+        drop_policy: str = "oldest",
+    ) -> None:
+        self._post_fn = post_fn
+        self.max_queue = max(1, max_queue)
+        self.batch_size = max(1, batch_size)
+        self.batch_wait = batch_wait
+        self.drop_policy = drop_policy
+        self._queue: "OrderedDict[Any, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._counters = {"enqueued": 0, "coalesced": 0, "dropped": 0, "delivered": 0, "failed": 0, "posts": 0}
+        self._last_latency: float | None = None
+        # Started on the first notification, so importing an app module starts no thread
+        self._thread: threading.Thread | None = None
+
+    def notify(self, payload: Dict[str, Any], coalesce_key: str | None = None) -> bool:
+        """Queues payload; returns False if it was refused because the queue is full."""
+        with self._cond:
+            if self._closed:
+                return False
+            if coalesce_key is not None and coalesce_key in self._queue:
+                enqueued_at, _ = self._queue[coalesce_key]
+                self._queue[coalesce_key] = (enqueued_at, payload)
+                self._counters["coalesced"] += 1
+                return True
+            if len(self._queue) >= self.max_queue:
+                self._counters["dropped"] += 1
+                if self.drop_policy == "newest":
+                    return False
+                self._queue.popitem(last=False)
+            key = coalesce_key if coalesce_key is not None else next(self._seq)
+            self._queue[key] = (time.monotonic(), payload)
+            self._counters["enqueued"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="notify", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return True
+
+    def _take_batch(self) -> List[Tuple[float, Dict[str, Any]]]:
+        with self._cond:
+            while not self._queue and not self._closed:
+                self._cond.wait()
+            if self.batch_size > 1:
+                deadline = time.monotonic() + self.batch_wait
+                while len(self._queue) < self.batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            batch = []
+            while self._queue and len(batch) < self.batch_size:
+                batch.append(self._queue.popitem(last=False)[1])
+            return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return  # closed and drained
+            if len(batch) == 1:
+                body = batch[0][1]
+            else:
+                body = {"event": "batch", "events": [payload for _, payload in batch]}
+            try:
+                result = self._post_fn(body)
+                ok = not result.get("error") and result.get("posted", True)
+            except Exception:
+                ok = False
+            with self._cond:
+                self._counters["posts"] += 1
+                self._counters["delivered" if ok else "failed"] += len(batch)
+                if ok:
+                    self._last_latency = time.monotonic() - batch[0][0]
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Stops accepting notifications and gives the queue up to timeout seconds to drain."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "queued": len(self._queue),
+                "max_queue": self.max_queue,
+                "batch_size": self.batch_size,
+                "drop_policy": self.drop_policy,
+                "last_delivery_latency_s": round(self._last_latency, 3) if self._last_latency is not None else None,
+                **self._counters,
+            }
@@ -0,0 +1,146 @@
+import io
+import multiprocessing
+import os
+import signal
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Deque, Iterator, List, NamedTuple, Tuple
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+from services import image_store
+from services.embedding_cache import image_key
+
+
+# Pages per worker task, and parser processes. Documents no longer than one
+# shard (or PARSE_WORKERS <= 1) are parsed inline without the pool.
+PARSE_SHARD_PAGES = int(os.getenv("PARSE_SHARD_PAGES", "8"))
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Shards parsed ahead of the embedding stage; bounds memory held in decoded images.
+PARSE_MAX_INFLIGHT = int(os.getenv("PARSE_MAX_INFLIGHT", str(max(2, PARSE_WORKERS * 2))))
+# Never fork a process that already holds torch/server threads: workers come
+# from a forkserver with only this module preloaded (spawn where there is no
+# forkserver, e.g. Windows). Workers still import the main module, which
+# must be import-safe and cheap: the app modules defer torch and background
+# threads until first use.
+PARSE_START_METHOD = os.getenv(
+    "PARSE_START_METHOD", "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+
+class ParsedImage(NamedTuple):
+    img_index: int
+    sha: str  # PNG already written to the image store
+    cache_key: str  # embedding cache key of the raw extracted bytes
+    image: Image.Image
+
+
+class ParsedPage(NamedTuple):
+    page_index: int
+    text: str
+    images: List[ParsedImage]
+
+
+def _to_png_bytes(image: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def parse_page_range(pdf_path: str, start: int, end: int, model_name: str) -> List[ParsedPage]:
+    """
+    Extracts text and images for pages [start, end). Runs in a worker process:
+    images are decoded, re-encoded to PNG and stored here, so the parent only
+    receives the decoded RGB image it needs for embedding.
+    """
+    pages: List[ParsedPage] = []
+    doc = fitz.open(pdf_path)
+    try:
+        for page_index in range(start, min(end, doc.page_count)):
+            page = doc[page_index]
+            text = page.get_text() or ""
+            images: List[ParsedImage] = []
+            for img_index, img in enumerate(page.get_images(full=True)):
+                try:
+                    base_image = doc.extract_image(img[0])
+                    image_bytes = base_image.get("image")
+                    pil_image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+                    sha = image_store.put_png(_to_png_bytes(pil_image))
+                    images.append(ParsedImage(img_index, sha, image_key(model_name, image_bytes), pil_image))
+                except Exception:
+                    continue
+            pages.append(ParsedPage(page_index, text, images))
+    finally:
+        doc.close()
+    return pages
+
+
+def _init_worker() -> None:
+    # Ctrl-C goes to the whole process group; the parent shuts the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+_pool: ProcessPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """One long-lived pool per process, so worker start-up is paid once."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            context = multiprocessing.get_context(PARSE_START_METHOD)
+            if PARSE_START_METHOD == "forkserver":
+                # Workers fork from a server that has already imported this module
+                context.set_forkserver_preload([__name__])
+            _pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=context, initializer=_init_worker)
+        return _pool
+
+
+def iter_pages(pdf_path: str, page_count: int, model_name: str) -> Iterator[ParsedPage]:
+    """
+    Yields parsed pages in order. Large documents are sharded by page range
+    across the parser pool with at most PARSE_MAX_INFLIGHT shards outstanding,
+    so parsing overlaps with whatever the caller does per page (embedding).
+    """
+    shards: List[Tuple[int, int]] = [
+        (start, min(start + PARSE_SHARD_PAGES, page_count)) for start in range(0, page_count, PARSE_SHARD_PAGES)
+    ]
+    if PARSE_WORKERS <= 1 or len(shards) <= 1:
+        for start, end in shards:
+            yield from parse_page_range(pdf_path, start, end, model_name)
+        return
+
+    pending: Deque[Future] = deque()
+    next_shard = 0  # next shard to submit
+    done_shards = 0  # shards already yielded
+    try:
+        pool = _get_pool()
+        while next_shard < len(shards) or pending:
+            while next_shard < len(shards) and len(pending) < PARSE_MAX_INFLIGHT:
+                start, end = shards[next_shard]
+                pending.append(pool.submit(parse_page_range, pdf_path, start, end, model_name))
+                next_shard += 1
+            pages = pending.popleft().result()
+            done_shards += 1
+            yield from pages
+    except (BrokenProcessPool, OSError, RuntimeError):
+        # A worker died (e.g. OOM on a huge image) or the pool could not start:
+        # drop the pool and finish this document inline.
+        shutdown_pool()
+        for start, end in shards[done_shards:]:
+            yield from parse_page_range(pdf_path, start, end, model_name)
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
@@ -0,0 +1,276 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict
+
+
+BASE_DIR = os.getcwd()
+DEFAULT_STORE_PATH = os.path.join(BASE_DIR, "data", "pending_responses.sqlite")
+
+# Unclaimed responses (and registrations nobody waits on any more) older than
+# this are dropped; e.g. a webhook answer that arrived after its request timed out.
+DEFAULT_TTL_SECONDS = 300.0
+DEFAULT_MAX_ENTRIES = 10000
+# Poll interval bounds for waiters on the SQLite backend
+_MIN_POLL_SECONDS = 0.005
+_MAX_POLL_SECONDS = 0.25
+
+
+def _approx_size(value: Any) -> int:
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+class _Slot:
+    __slots__ = ("event", "value", "created", "size", "waiters")
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.value: Any = None
+        self.created = time.monotonic()
+        self.size = 0
+        self.waiters = 0
+
+
+class ResponseWaiters:
+    """
+    Hands webhook responses to the request thread waiting for them. A waiter
+    blocks on its own Event, which deliver() sets the moment /webhook_response
+    stores the data, so there is no polling delay and no thread spins.
+
+    register() before sending the request so a response that arrives early is
+    not lost; a response for an id nobody registered is kept until claimed, or
+    until ttl_seconds pass. At most max_entries slots are held: beyond that the
+    oldest ones nobody is blocked on are dropped. Single process only.
+    """
+
+    def __init__(self, ttl_seconds: float = DEFAULT_TTL_SECONDS, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._slots: "OrderedDict[str, _Slot]" = OrderedDict()
+        self._bytes = 0
+        self._counters = {"delivered": 0, "claimed": 0, "timed_out": 0, "expired": 0, "evicted": 0}
+
+    def _drop(self, request_id: str, counter: str | None = None) -> None:
+        slot = self._slots.pop(request_id, None)
+        if slot is not None:
+            self._bytes -= slot.size
+            if counter:
+                self._counters[counter] += 1
+
+    def _sweep(self) -> None:
+        """Expires idle slots past their TTL, then trims to max_entries. Caller holds the lock."""
+        cutoff = time.monotonic() - self.ttl_seconds
+        for request_id, slot in list(self._slots.items()):
+            if slot.created > cutoff:
+                break  # insertion ordered: everything after is newer
+            if not slot.waiters:
+                self._drop(request_id, "expired")
+        if len(self._slots) > self.max_entries:
+            idle = [rid for rid, slot in self._slots.items() if not slot.waiters]
+            for request_id in idle[: len(self._slots) - self.max_entries]:
+                self._drop(request_id, "evicted")
+
+    def _slot(self, request_id: str) -> _Slot:
+        slot = self._slots.get(request_id)
+        if slot is None:
+            slot = self._slots[request_id] = _Slot()
+            self._sweep()
+        return slot
+
+    def register(self, request_id: str) -> None:
+        with self._lock:
+            self._slot(request_id)
+
+    def deliver(self, request_id: str, value: Any) -> bool:
+        """Stores value for request_id; returns True if someone was already waiting."""
+        size = _approx_size(value)
+        with self._lock:
+            waiting = request_id in self._slots
+            slot = self._slot(request_id)
+            self._bytes += size - slot.size
+            slot.size = size
+            slot.value = value
+            self._counters["delivered"] += 1
+        slot.event.set()
+        return waiting
+
+    def wait(self, request_id: str, timeout: float) -> Any | None:
+        """Blocks up to timeout seconds; returns the response (and forgets it) or None."""
+        with self._lock:
+            slot = self._slot(request_id)
+            slot.waiters += 1
+        try:
+            got = slot.event.wait(timeout)
+        finally:
+            with self._lock:
+                slot.waiters -= 1
+                if self._slots.get(request_id) is slot:
+                    self._drop(request_id, "claimed" if got else "timed_out")
+        return slot.value if got else None
+
+    def discard(self, request_id: str) -> None:
+        with self._lock:
+            self._drop(request_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._slots),
+                "max_entries": self.max_entries,
+                "approx_bytes": self._bytes,
+                "ttl_seconds": self.ttl_seconds,
+                **self._counters,
+            }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._slots)
+
+
+class SqliteResponseWaiters:
+    """
+    Same interface as ResponseWaiters, backed by a SQLite file so that
+    /webhook_response handled by one gunicorn worker reaches the request
+    waiting in another. Waiters poll with backoff (5ms up to 250ms); a
+    delivery in the waiter's own process wakes it immediately.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_STORE_PATH,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._local: Dict[str, threading.Event] = {}
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pending (request_id TEXT PRIMARY KEY, value TEXT, created REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS pending_created ON pending(created)")
+        self._conn.commit()
+        self._counters = {"delivered": 0, "claimed": 0, "timed_out": 0}
+
+    def _sweep(self) -> None:
+        """Caller holds the lock; commits with the caller's write."""
+        self._conn.execute("DELETE FROM pending WHERE created < ?", (time.time() - self.ttl_seconds,))
+        self._conn.execute(
+            "DELETE FROM pending WHERE request_id IN "
+            "(SELECT request_id FROM pending ORDER BY created DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def register(self, request_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO pending (request_id, value, created) VALUES (?, NULL, ?)",
+                (request_id, time.time()),
+            )
+            self._sweep()
+            self._conn.commit()
+
+    def deliver(self, request_id: str, value: Any) -> bool:
+        """Stores value for request_id; returns True if someone had registered it."""
+        data = json.dumps(value, default=str)
+        with self._lock:
+            waiting = (
+                self._conn.execute("SELECT 1 FROM pending WHERE request_id = ?", (request_id,)).fetchone() is not None
+            )
+            self._conn.execute(
+                "INSERT INTO pending (request_id, value, created) VALUES (?, ?, ?) "
+                "ON CONFLICT(request_id) DO UPDATE SET value = excluded.value",
+                (request_id, data, time.time()),
+            )
+            self._sweep()
+            self._conn.commit()
+            self._counters["delivered"] += 1
+            event = self._local.get(request_id)
+        if event is not None:
+            event.set()
+        return waiting
+
+    def _take(self, request_id: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM pending WHERE request_id = ?", (request_id,)).fetchone()
+            if row is None or row[0] is None:
+                return None
+            self._conn.execute("DELETE FROM pending WHERE request_id = ?", (request_id,))
+            self._conn.commit()
+            return row[0]
+
+    def wait(self, request_id: str, timeout: float) -> Any | None:
+        """Blocks up to timeout seconds; returns the response (and forgets it) or None."""
+        self.register(request_id)
+        event = threading.Event()
+        with self._lock:
+            self._local[request_id] = event
+        deadline = time.monotonic() + timeout
+        interval = _MIN_POLL_SECONDS
+        try:
+            while True:
+                data = self._take(request_id)
+                if data is not None:
+                    self._counters["claimed"] += 1
+                    return json.loads(data)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters["timed_out"] += 1
+                    return None
+                event.wait(min(interval, remaining))
+                event.clear()
+                interval = min(interval * 2, _MAX_POLL_SECONDS)
+        finally:
+            with self._lock:
+                self._local.pop(request_id, None)
+            self.discard(request_id)
+
+    def discard(self, request_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM pending WHERE request_id = ?", (request_id,))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, approx_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM pending"
+            ).fetchone()
+            return {
+                "backend": "sqlite",
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "approx_bytes": approx_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                **self._counters,
+            }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+
+def get_response_waiters() -> ResponseWaiters | SqliteResponseWaiters:
+    """
+    Store selected by PENDING_STORE: "memory" (default, one process) or
+    "sqlite" (shared by all workers on the host via PENDING_STORE_PATH).
+    """
+    ttl_seconds = float(os.getenv("PENDING_TTL_SECONDS", str(DEFAULT_TTL_SECONDS)))
+    max_entries = int(os.getenv("PENDING_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES)))
+    if os.getenv("PENDING_STORE", "memory").lower() == "sqlite":
+        return SqliteResponseWaiters(
+            path=os.getenv("PENDING_STORE_PATH", DEFAULT_STORE_PATH), ttl_seconds=ttl_seconds, max_entries=max_entries
+        )
+    return ResponseWaiters(ttl_seconds=ttl_seconds, max_entries=max_entries)
@@ -0,0 +1,273 @@
+import os
+from typing import Any, Callable, Dict, List, NamedTuple, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from services import mmap_store
+
+
+# Per-position chunk metadata (document, type, page) with the selections
+# search filters need precomputed: positions grouped per document (CSR) and a
+# packed bitmap per chunk type in faiss.IDSelectorBitmap layout. Positions are
+# flat-store order, as in the ANN and BM25 indexes.
+#
+# On-disk layout (memory-mapped on load):
+#   manifest.json                 {"format", "count", "doc_values", "type_values"}
+#   doc_codes.npy / type_codes.npy int32 index into doc_values / type_values per position
+#   pages.npy                     int32 per position, -1 when a chunk has no page
+#   doc_offsets.npy / doc_positions.npy  positions of doc d are doc_positions[doc_offsets[d]:doc_offsets[d + 1]]
+#   type_bitmaps.npy              uint8 (types, ceil(count / 8)), little-endian bit order
+FORMAT_VERSION = 1
+_ARRAYS = ("doc_codes", "type_codes", "pages", "doc_offsets", "doc_positions", "type_bitmaps")
+
+
+class SearchFilter(NamedTuple):
+    """Restricts a search to chunks matching every given criterion; empty criteria match all."""
+
+    doc_ids: Tuple[str, ...] = ()
+    types: Tuple[str, ...] = ()
+    page_min: int | None = None  # inclusive, same numbering as hit metadata["page"]
+    page_max: int | None = None
+
+    def active(self) -> bool:
+        return bool(self.doc_ids or self.types or self.page_min is not None or self.page_max is not None)
+
+
+class FilterIndex(NamedTuple):
+    doc_values: List[str]
+    type_values: List[str]
+    doc_codes: np.ndarray
+    type_codes: np.ndarray
+    pages: np.ndarray
+    doc_offsets: np.ndarray
+    doc_positions: np.ndarray
+    type_bitmaps: np.ndarray
+
+    @property
+    def count(self) -> int:
+        return len(self.doc_codes)
+
+
+def _finish(
+    doc_values: List[str], type_values: List[str], doc_codes: np.ndarray, type_codes: np.ndarray, pages: np.ndarray
+) -> FilterIndex:
+    """Index with the per-document and per-type selections computed from the code columns."""
+    doc_offsets = np.zeros(len(doc_values) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(doc_codes, minlength=len(doc_values)), out=doc_offsets[1:])
+    doc_positions = np.argsort(doc_codes, kind="stable").astype(np.int32)
+    type_bitmaps = np.zeros((len(type_values), (len(doc_codes) + 7) // 8), dtype=np.uint8)
+    for code in range(len(type_values)):
+        type_bitmaps[code] = np.packbits(type_codes == code, bitorder="little")
+    return FilterIndex(doc_values, type_values, doc_codes, type_codes, pages, doc_offsets, doc_positions, type_bitmaps)
+
+
+def empty() -> FilterIndex:
+    none = np.zeros(0, dtype=np.int32)
+    return _finish([], [], none, none, none)
+
+
+def _encoder(values: List[str]) -> Callable[[Any], int]:
+    """value -> code in values, appending values not seen before."""
+    codes = {value: code for code, value in enumerate(values)}
+
+    def encode(value: Any) -> int:
+        value = "" if value is None else str(value)
+        if value not in codes:
+            codes[value] = len(values)
+            values.append(value)
+        return codes[value]
+
+    return encode
+
+
+def add(index: FilterIndex, metadatas: List[Dict[str, Any]]) -> FilterIndex:
+    """Copy of index with chunks of the given metadata appended."""
+    if not metadatas:
+        return index
+    doc_values, type_values = list(index.doc_values), list(index.type_values)
+    encode_doc, encode_type = _encoder(doc_values), _encoder(type_values)
+    doc_codes = [encode_doc(m.get("doc_id")) for m in metadatas]
+    type_codes = [encode_type(m.get("type")) for m in metadatas]
+    pages = [m["page"] if isinstance(m.get("page"), int) else -1 for m in metadatas]
+    return _finish(
+        doc_values,
+        type_values,
+        np.concatenate([index.doc_codes, np.asarray(doc_codes, dtype=np.int32)]),
+        np.concatenate([index.type_codes, np.asarray(type_codes, dtype=np.int32)]),
+        np.concatenate([index.pages, np.asarray(pages, dtype=np.int32)]),
+    )
+
+
+def _compact(values: List[str], codes: np.ndarray) -> Tuple[List[str], np.ndarray]:
+    """Drops values no position uses any more."""
+    used = np.unique(codes)
+    remap = np.full(len(values), -1, dtype=np.int32)
+    remap[used] = np.arange(len(used), dtype=np.int32)
+    return [values[i] for i in used], remap[codes]
+
+
+def remove(index: FilterIndex, removed: Sequence[int]) -> FilterIndex:
+    """Copy of index without the chunks at positions removed."""
+    removed = np.unique(np.asarray(removed, dtype=np.int64))
+    if not len(removed):
+        return index
+    doc_values, doc_codes = _compact(index.doc_values, np.delete(np.asarray(index.doc_codes), removed))
+    type_values, type_codes = _compact(index.type_values, np.delete(np.asarray(index.type_codes), removed))
+    return _finish(doc_values, type_values, doc_codes, type_codes, np.delete(np.asarray(index.pages), removed))
+
+
+def build(metadatas: List[Dict[str, Any]]) -> FilterIndex:
+    return add(empty(), metadatas)
+
+
+# Set bits per byte value, to count a packed bitmap without unpacking it
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.int64)
+
+
+class Selection(NamedTuple):
+    """
+    Positions a filter admits, in whichever form it was cheapest to get:
+    ascending positions (document filters cost only those documents' chunks)
+    or a packed bitmap in IDSelectorBitmap layout (type and page filters).
+    """
+
+    count: int  # positions in the index
+    positions: np.ndarray | None = None
+    bits: np.ndarray | None = None
+
+    def size(self) -> int:
+        if self.positions is not None:
+            return len(self.positions)
+        return int(_POPCOUNT[self.bits].sum())
+
+    def to_positions(self) -> np.ndarray:
+        """Admitted positions, ascending; for a bitmap only its non-zero bytes are unpacked."""
+        if self.positions is not None:
+            return self.positions
+        nonzero = np.flatnonzero(self.bits)
+        offsets = np.flatnonzero(np.unpackbits(self.bits[nonzero], bitorder="little"))
+        return nonzero[offsets >> 3] * 8 + (offsets & 7)
+
+    def admits(self, positions: np.ndarray) -> np.ndarray:
+        """Boolean per position in positions: whether the filter admits it."""
+        positions = np.asarray(positions, dtype=np.int64)
+        if self.bits is not None:
+            return _bit_test(self.bits, positions)
+        if not len(self.positions):
+            return np.zeros(len(positions), dtype=bool)
+        found = np.minimum(np.searchsorted(self.positions, positions), len(self.positions) - 1)
+        return self.positions[found] == positions
+
+
+def select(index: FilterIndex, search_filter: SearchFilter | None) -> Selection | None:
+    """
+    Positions search_filter admits, or None when it admits everything. With
+    doc_ids, only those documents' chunks are looked at; otherwise type
+    filters combine the packed type bitmaps byte-wise, and only a page range
+    without doc_ids reads the page of every chunk.
+    """
+    if search_filter is None or not search_filter.active():
+        return None
+    n = index.count
+    page_min, page_max = search_filter.page_min, search_filter.page_max
+    has_pages = page_min is not None or page_max is not None
+    type_codes = [c for c in (_code(index.type_values, t) for t in search_filter.types) if c is not None]
+    if search_filter.types and not type_codes:
+        return Selection(n, positions=np.zeros(0, dtype=np.int64))
+    if search_filter.doc_ids:
+        doc_ids = dict.fromkeys(search_filter.doc_ids)
+        positions = np.concatenate([document_positions(index, d) for d in doc_ids]).astype(np.int64)
+        if len(doc_ids) > 1:
+            positions.sort()
+        if has_pages:
+            positions = positions[_page_match(index.pages[positions], page_min, page_max)]
+        if type_codes:
+            by_type = np.zeros(len(positions), dtype=bool)
+            for code in type_codes:
+                by_type |= _bit_test(index.type_bitmaps[code], positions)
+            positions = positions[by_type]
+        return Selection(n, positions=positions)
+    bits = None
+    if type_codes:
+        bits = np.bitwise_or.reduce(index.type_bitmaps[type_codes], axis=0)
+    if has_pages:
+        by_page = np.packbits(_page_match(np.asarray(index.pages), page_min, page_max), bitorder="little")
+        bits = by_page if bits is None else np.bitwise_and(bits, by_page)
+    return Selection(n, bits=bits)
+
+
+def document_positions(index: FilterIndex, doc_id: str) -> np.ndarray:
+    """Positions of doc_id's chunks, ascending."""
+    code = _code(index.doc_values, doc_id)
+    if code is None:
+        return np.zeros(0, dtype=np.int32)
+    return np.asarray(index.doc_positions[index.doc_offsets[code] : index.doc_offsets[code + 1]])
+
+
+def has_type(index: FilterIndex, positions: np.ndarray, chunk_type: str) -> np.ndarray:
+    """Boolean per position in positions: whether that chunk is of chunk_type."""
+    code = _code(index.type_values, chunk_type)
+    positions = np.asarray(positions, dtype=np.int64)
+    if code is None:
+        return np.zeros(len(positions), dtype=bool)
+    return _bit_test(index.type_bitmaps[code], positions)
+
+
+def _bit_test(bits: np.ndarray, positions: np.ndarray) -> np.ndarray:
+    return (bits[positions >> 3] >> (positions & 7) & 1).astype(bool)
+
+
+def _code(values: List[str], value: str) -> int | None:
+    try:
+        return values.index(value)
+    except ValueError:
+        return None
+
+
+def _page_match(pages: np.ndarray, page_min: int | None, page_max: int | None) -> np.ndarray:
+    match = pages >= (0 if page_min is None else page_min)
+    if page_max is not None:
+        match &= pages <= page_max
+    return match
+
+
+def id_selector(selection: Selection) -> Tuple[faiss.IDSelector, Any]:
+    """
+    FAISS selector for selection: IDSelectorBitmap over a bitmap, a range
+    for one contiguous run of positions (a single document), else a batch.
+    The selector may point at the returned array: keep it referenced until
+    the search has finished.
+    """
+    if selection.bits is not None:
+        bits = np.ascontiguousarray(selection.bits)
+        return faiss.IDSelectorBitmap(selection.count, faiss.swig_ptr(bits)), bits
+    positions = selection.positions
+    if len(positions) and positions[-1] - positions[0] + 1 == len(positions):
+        return faiss.IDSelectorRange(int(positions[0]), int(positions[-1]) + 1), None
+    positions = np.ascontiguousarray(positions, dtype=np.int64)
+    return faiss.IDSelectorBatch(len(positions), faiss.swig_ptr(positions)), positions
+
+
+def write(index: FilterIndex, directory: str) -> None:
+    """Writes index to directory, which must not exist yet."""
+    os.makedirs(directory)
+    mmap_store.save_arrays(directory, {name: getattr(index, name) for name in _ARRAYS})
+    mmap_store.write_manifest(
+        directory, FORMAT_VERSION, count=index.count, doc_values=index.doc_values, type_values=index.type_values
+    )
+
+
+def load(directory: str) -> FilterIndex:
+    manifest = mmap_store.read_manifest(directory, FORMAT_VERSION)
+    return FilterIndex(
+        doc_values=manifest["doc_values"],
+        type_values=manifest["type_values"],
+        **mmap_store.load_arrays(directory, _ARRAYS),
+    )
+
+
+def describe(index: FilterIndex | None) -> Dict[str, Any]:
+    if index is None:
+        return {"documents": 0, "types": []}
+    return {"documents": len(index.doc_values), "types": list(index.type_values)}
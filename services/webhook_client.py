@@ -0,0 +1,175 @@
+import os
+import random
+import threading
+import time
+from typing import Any, Dict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from services import metrics
+
+
+# 503 is retried for any request: the webhook is refusing work. 502/504 come
+# from a proxy that may already have forwarded the request, so they (like a
+# dropped connection) are retried only for idempotent posts.
+_RETRY_STATUSES = frozenset({503})
+_IDEMPOTENT_RETRY_STATUSES = frozenset({502, 503, 504})
+
+
+class CircuitOpen(requests.exceptions.ConnectionError):
+    """Raised without touching the network while the webhook is considered down."""
+
+
+class WebhookClient:
+    """
+    Keep-alive HTTP client for the n8n webhook. One requests.Session with a
+    pool of pool_size connections is shared by all request threads.
+
+    Without idempotent=True only failures where the request cannot have been
+    acted on are retried: the connection could not be established (refused,
+    connect timeout) or the webhook answered 503. Idempotent posts (or posts
+    carrying an idempotency key) are also retried on other connection errors
+    and on 502/504. Retries use full-jitter exponential backoff. After
+    failure_threshold consecutive failures the circuit opens and post()
+    raises CircuitOpen immediately for reset_seconds; then a single trial
+    request decides whether it closes again.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 30.0,
+        retries: int = 2,
+        backoff_seconds: float = 0.2,
+        failure_threshold: int = 5,
+        reset_seconds: float = 30.0,
+    ) -> None:
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_seconds = backoff_seconds
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._trial_in_flight = False
+        self._counters = {"requests": 0, "retries": 0, "failures": 0, "short_circuited": 0}
+
+    def _before_request(self) -> None:
+        with self._lock:
+            self._counters["requests"] += 1
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._trial_in_flight:
+                self._counters["short_circuited"] += 1
+                raise CircuitOpen("Webhook circuit open; failing fast")
+            self._trial_in_flight = True  # half-open: let exactly one request through
+
+    def _record(self, ok: bool) -> None:
+        with self._lock:
+            self._trial_in_flight = False
+            if ok:
+                self._failures = 0
+                self._opened_at = None
+                return
+            self._counters["failures"] += 1
+            self._failures += 1
+            if self._failures >= self.failure_threshold or self._opened_at is not None:
+                self._opened_at = time.monotonic()
+
+    def post(
+        self,
+        url: str,
+        payload: Dict[str, Any],
+        idempotent: bool = False,
+        idempotency_key: str | None = None,
+    ) -> requests.Response:
+        """
+        POSTs payload as JSON. Raises requests exceptions (CircuitOpen included) on failure.
+
+        Pass idempotent=True only if the webhook may safely see payload twice.
+        idempotency_key is sent as an Idempotency-Key header on every attempt,
+        for webhooks that deduplicate on it, and implies idempotent.
+        """
+        try:
+            self._before_request()
+        except CircuitOpen:
+            metrics.WEBHOOK_ERRORS.inc(kind="circuit_open")
+            raise
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else None
+        with metrics.STAGE_SECONDS.time(stage="webhook"):
+            return self._post(url, payload, headers, idempotent or idempotency_key is not None)
+
+    def _post(
+        self, url: str, payload: Dict[str, Any], headers: Dict[str, str] | None, idempotent: bool
+    ) -> requests.Response:
+        retry_statuses = _IDEMPOTENT_RETRY_STATUSES if idempotent else _RETRY_STATUSES
+        attempt = 0
+        while True:
+            try:
+                resp = self._session.post(url, json=payload, headers=headers, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                connect = isinstance(e, requests.exceptions.ConnectionError)
+                # A ReadTimeout or a dropped connection may have been processed
+                retryable = _never_sent(e) or (idempotent and connect)
+                if not retryable or attempt >= self.retries:
+                    self._record(False)
+                    metrics.WEBHOOK_ERRORS.inc(kind="connect" if connect else type(e).__name__.lower())
+                    raise
+            else:
+                if resp.status_code not in retry_statuses or attempt >= self.retries:
+                    self._record(resp.status_code < 500)
+                    if resp.status_code >= 400:
+                        metrics.WEBHOOK_ERRORS.inc(kind=f"http_{resp.status_code}")
+                    return resp
+                resp.close()
+            with self._lock:
+                self._counters["retries"] += 1
+            time.sleep(random.uniform(0, self.backoff_seconds * (2**attempt)))
+            attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            if self._opened_at is None:
+                state = "closed"
+            elif time.monotonic() - self._opened_at < self.reset_seconds:
+                state = "open"
+            else:
+                state = "half_open"
+            return {"circuit": state, "consecutive_failures": self._failures, **self._counters}
+
+
+def _never_sent(e: requests.exceptions.RequestException) -> bool:
+    """True if the connection was never established, so the webhook cannot have seen the request."""
+    if isinstance(e, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(e.args[0], "reason", None) if e.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+_client: WebhookClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_webhook_client() -> WebhookClient:
+    """Process-wide client, configured from WEBHOOK_* env vars."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = WebhookClient(
+                    pool_size=int(os.getenv("WEBHOOK_POOL_SIZE", "10")),
+                    connect_timeout=float(os.getenv("WEBHOOK_CONNECT_TIMEOUT", "3.05")),
+                    read_timeout=float(os.getenv("WEBHOOK_READ_TIMEOUT", "30")),
+                    retries=int(os.getenv("WEBHOOK_RETRIES", "2")),
+                    failure_threshold=int(os.getenv("WEBHOOK_BREAKER_FAILURES", "5")),
+                    reset_seconds=float(os.getenv("WEBHOOK_BREAKER_RESET_SECONDS", "30")),
+                )
+    return _client